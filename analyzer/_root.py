@@ -0,0 +1,9 @@
+import os
+import sys
+
+# the scripts in analyzer/ import this before anything from the repository root:
+# archive_scan, record_io, pipeline_metrics and the other helpers shared with
+# pyscraper.py live one folder up, and this puts that folder on sys.path once
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
@@ -2,24 +2,108 @@ import os
 import json
 import subprocess
 import sys
+import argparse
+import queue
+import threading
+import time
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import _root
+from archive_scan import head_commit
+from scrape_cache import ScrapeCache
+from metrics_cache import BlobMetricsCache, FILE_FIELDS
+from repo_store import RepoStore
+from record_io import RecordWriter, is_jsonl, load_records
+from path_rules import default_classifier
+import pipeline_metrics
+from pipeline_metrics import metrics
+
+# rs_path_file attributes are relative to this folder
+ANALYZER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# rough cost model for scheduling: cloning grows with every file in the
+# repository, parsing with its .rs files. only the ratio matters for the order,
+# the absolute numbers are just there to compare against the measured times
+CLONE_SECONDS_PER_FILE = 0.0002
+PARSE_SECONDS_PER_RS_FILE = 0.005
 
 def main():
+    args = parse_args()
+    if args.trace:
+        metrics.enable_trace()
     # file containing repos, with clone_url attributes
-    json_file = sys.argv[1]
+    json_file = args.json_file
+    # optional scraper cache, used when an rs_paths file is missing
+    cache = ScrapeCache(args.cache) if args.cache else None
+    # per-file results by git blob, shared across runs
+    blob_cache = BlobMetricsCache(args.blob_cache, args.blob_cache_max_entries) if args.blob_cache else None
+    # bare mirrors kept between runs, only new objects are fetched
+    repo_store = RepoStore(args.repo_store, int(args.repo_store_max_gb * 1024 ** 3) if args.repo_store_max_gb else None) \
+        if args.repo_store else None
     # rust binary
     rust_binary = os.path.join(os.getcwd(), "rust_ffi_metrics","target", "release","rust_ffi_metrics.exe")
 
     
     workspace = os.path.join(os.getcwd(), "rust_clones")
 
-    analyze_json_repos(json_file, rust_binary, workspace, max_repo_size = 2000000000, max_count=2000, delete_after=True)
+    analyze_json_repos(json_file, rust_binary, workspace, max_repo_size = 2000000000, output_file=args.output,
+                       max_count=2000, delete_after=True, cache=cache,
+                       clone_workers=args.clone_workers, analysis_workers=args.analysis_workers,
+                       batch=args.batch, timeout=args.timeout, timeout_per_file=args.timeout_per_file,
+                       parse_threads=args.parse_threads, manifest=args.manifest, blob_cache=blob_cache,
+                       blob_fetch=args.blob_fetch, repo_store=repo_store, schedule=args.schedule)
+    if blob_cache:
+        blob_cache.evict()
+        blob_cache.close()
+    if repo_store:
+        repo_store.evict()
+
+    metrics.report(args.metrics, args.trace)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="clone rust repositories and collect ffi metrics")
+    parser.add_argument("json_file", help="json file of repositories with clone_url and rs_path_file attributes")
+    parser.add_argument("cache", nargs="?", default=None,
+                        help="optional scraper cache file, used when an rs_paths file is missing")
+    parser.add_argument("--output", default="ffi_metrics.json",
+                        help="metrics file, a .jsonl name gets one line per repository as soon as it is analyzed")
+    parser.add_argument("--clone-workers", type=int, default=1,
+                        help="repositories cloned at the same time")
+    parser.add_argument("--analysis-workers", type=int, default=1,
+                        help="rust_ffi_metrics processes run at the same time")
+    parser.add_argument("--batch", action="store_true",
+                        help="keep rust_ffi_metrics --stdin processes running instead of one process per repository")
+    parser.add_argument("--parse-threads", type=int, default=None,
+                        help="threads each rust_ffi_metrics process parses files with, default every core")
+    parser.add_argument("--manifest", action="store_true",
+                        help="pass the rs_paths list to rust_ffi_metrics --files instead of letting it walk the clone")
+    parser.add_argument("--blob-cache", default=None,
+                        help="sqlite file of per-file metrics keyed by git blob, only unseen blobs are parsed")
+    parser.add_argument("--blob-cache-max-entries", type=int, default=1000000,
+                        help="blobs kept in the blob cache, least recently used are dropped first")
+    parser.add_argument("--blob-fetch", action="store_true",
+                        help="bare blobless clones, only the .rs blobs are fetched and rust_ffi_metrics reads them with --git")
+    parser.add_argument("--repo-store", default=None,
+                        help="folder of bare mirrors kept between runs, repositories are fetched into them instead of cloned")
+    parser.add_argument("--repo-store-max-gb", type=float, default=None,
+                        help="disk quota of the repo store, least recently used mirrors are removed after the run")
+    parser.add_argument("--schedule", choices=["largest", "input"], default="largest",
+                        help="start the most expensive repositories first (default) or keep the json order")
+    parser.add_argument("--timeout", type=float, default=60,
+                        help="seconds a repository may take to analyze")
+    parser.add_argument("--timeout-per-file", type=float, default=0,
+                        help="extra seconds allowed per .rs file, so big repositories get longer")
+    pipeline_metrics.add_arguments(parser)
+    return parser.parse_args()
 
 def clone_repo(clone_url, target_dir):
     if os.path.exists(target_dir):
         print(f"[+] Repo already cloned: {target_dir}")
         return True
     try:
-        subprocess.run(["git", "clone", "--depth=1", clone_url, target_dir], check=True)
+        with metrics.stage("clone"):
+            subprocess.run(["git", "clone", "--depth=1", clone_url, target_dir], check=True)
         print(f"[+] Cloned: {clone_url}")
         return True
     except subprocess.CalledProcessError:
@@ -31,24 +115,96 @@ def clone_repo_sparse(clone_url, target_dir, rs_paths=None):
         print(f"[+] Repo already cloned: {target_dir}")
         return True
     try:
-        subprocess.run(["git", "clone", "--filter=blob:none", "--no-checkout", clone_url, target_dir], check=True)
+        with metrics.stage("clone"):
+            subprocess.run(["git", "clone", "--filter=blob:none", "--no-checkout", clone_url, target_dir], check=True)
         print(f"[+] Cloned (sparse): {clone_url}")
         if rs_paths:
-            os.chdir(target_dir)
-            subprocess.run(["git", "sparse-checkout", "init", "--cone"], check=True)
-            subprocess.run(["git", "sparse-checkout", "set"] + rs_paths, check=True)
-            subprocess.run(["git", "checkout"], check=True)
-            os.chdir("..")
+            # git -C keeps the working directory untouched so clones can run in parallel
+            with metrics.stage("sparse checkout"):
+                subprocess.run(["git", "-C", target_dir, "sparse-checkout", "init", "--cone"], check=True)
+                subprocess.run(["git", "-C", target_dir, "sparse-checkout", "set"] + rs_paths, check=True)
+                subprocess.run(["git", "-C", target_dir, "checkout"], check=True)
+        return True
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"[!] Failed to clone: {clone_url}")
+        return False
+
+# bare clone with every commit and tree but no blobs and no working tree,
+# fetch_blobs later pulls in only the blobs that get analyzed
+def clone_repo_blobless(clone_url, target_dir, rs_paths=None):
+    if os.path.exists(target_dir):
+        print(f"[+] Repo already cloned: {target_dir}")
+        return True
+    try:
+        with metrics.stage("clone"):
+            subprocess.run(["git", "clone", "--bare", "--filter=blob:none", clone_url, target_dir], check=True)
+        print(f"[+] Cloned (blobless): {clone_url}")
         return True
     except (subprocess.CalledProcessError, OSError) as e:
         print(f"[!] Failed to clone: {clone_url}")
         return False
 
-def get_rs_paths(filepath):
+# sparse worktree of the store's mirror of clone_url, fetching only what the
+# mirror does not have yet. the .rs blobs come over in one fetch before checkout
+def clone_from_store(store, clone_url, target_dir, rs_paths=None):
+    with metrics.stage("clone"):
+        mirror = store.update(clone_url)
+    if mirror is None:
+        return False
+    if os.path.exists(target_dir):
+        print(f"[+] Repo already cloned: {target_dir}")
+        return True
+    try:
+        if rs_paths:
+            fetch_blobs(mirror, rs_paths)
+        with metrics.stage("sparse checkout"):
+            subprocess.run(["git", "-C", mirror, "worktree", "add", "--detach", "--no-checkout", target_dir, "HEAD"],
+                           check=True)
+            if rs_paths:
+                subprocess.run(["git", "-C", target_dir, "sparse-checkout", "init", "--cone"], check=True)
+                subprocess.run(["git", "-C", target_dir, "sparse-checkout", "set"] + rs_paths, check=True)
+            subprocess.run(["git", "-C", target_dir, "checkout"], check=True)
+        return True
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"[!] Failed to check out from mirror: {clone_url}")
+        return False
+
+# with blob_fetch the mirror itself is analyzed, there is nothing to check out
+def mirror_from_store(store, clone_url, target_dir, rs_paths=None):
+    with metrics.stage("clone"):
+        return store.update(clone_url) is not None
+
+# downloads the blobs of paths in one fetch, the way git itself backfills a
+# partial clone. without it every blob rust_ffi_metrics --git reads would be
+# fetched on its own. a failed fetch is not fatal, git still fetches lazily
+def fetch_blobs(repo_path, paths):
+    try:
+        blobs = set(list_blobs(repo_path, paths).values())
+        # rev-list reports missing objects as "?<sha>" without fetching them, cat-file would
+        missing = subprocess.run(["git", "-C", repo_path, "rev-list", "--objects", "--missing=print", "HEAD"],
+                                 capture_output=True, text=True, check=True).stdout
+        wanted = [line[1:] for line in missing.splitlines() if line.startswith("?") and line[1:] in blobs]
+        if not wanted:
+            return
+        metrics.count("blobs fetched", len(wanted))
+        with metrics.stage("blob fetch"):
+            subprocess.run(["git", "-c", "fetch.negotiationAlgorithm=noop", "-C", repo_path, "fetch", "origin",
+                            "--no-tags", "--no-write-fetch-head", "--recurse-submodules=no", "--filter=blob:none",
+                            "--stdin"],
+                           input="".join(sha + "\n" for sha in wanted), text=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    except (subprocess.CalledProcessError, OSError):
+        print(f"[!] Failed to prefetch blobs in {repo_path}")
+
+def get_rs_paths(filepath, clone_url=None, commit=None, cache=None):
     #path to rs_paths/git_file_path.rs
     
     print(f"rs_path_file: {filepath}")
-    if not filepath or not os.path.exists(filepath):
+    if not filepath or not os.path.isfile(filepath):
+        # fall back to the archive listing the scraper cached for this commit
+        listing = cache.get_listing(clone_url, commit) if cache and commit else None
+        if listing is not None:
+            return [path for path in listing if path.endswith(".rs")]
         print(f"could not find filepath{filepath}")
         return None  # No sparse paths available
 
@@ -74,13 +230,22 @@ def analyze_repo(path, rust_binary):
         return None
 '''
 
-def analyze_repo(repo_path, rust_binary):
+# threads sets rust_ffi_metrics --threads, None leaves it to the binary (every core)
+# manifest is a file of .rs paths to read instead of walking the checkout
+def analyze_repo(repo_path, rust_binary, timeout=60, threads=None, manifest=None):
+    data = run_metrics(repo_path, rust_binary, timeout, threads, manifest)
+    return metrics_from_stats(data) if data else None
+
+# raw rust_ffi_metrics output as a dict, or None
+def run_metrics(repo_path, rust_binary, timeout=60, threads=None, manifest=None, per_file=False, from_git=False):
+    files_args = ["--files", manifest] if manifest else []
     try:
-        result = subprocess.check_output(
-            [rust_binary, repo_path],
-            stderr=subprocess.DEVNULL,
-            timeout=60
-        ).decode("utf-8")
+        with metrics.stage("rust analysis"):
+            result = subprocess.check_output(
+                [rust_binary] + metrics_args(threads, per_file, from_git) + files_args + [repo_path],
+                stderr=subprocess.DEVNULL,
+                timeout=timeout
+            ).decode("utf-8")
     except subprocess.CalledProcessError:
         print(f"Failed to analyze {repo_path}")
         return None
@@ -88,12 +253,157 @@ def analyze_repo(repo_path, rust_binary):
         print(f"Timed out analyzing {repo_path}")
         return None
 
+    return load_output(result, repo_path)
+
+# from_git reads the files from HEAD's blobs, for clones without a working tree
+def metrics_args(threads=None, per_file=False, from_git=False):
+    args = ["--threads", str(threads)] if threads else []
+    if per_file:
+        args.append("--per-file")
+    if from_git:
+        args.append("--git")
+    return args
+
+# same as run_metrics, but sends the repo to a long-lived worker from pool
+def run_metrics_batched(repo_path, pool, timeout=60, manifest=None):
+    with metrics.stage("rust analysis"):
+        result = pool.analyze(repo_path, timeout, manifest)
+    if result is None:
+        return None
+    return load_output(result, repo_path)
+
+# git blob sha of each of rs_paths that exists at HEAD
+# a blob:none clone already has every tree, so this fetches nothing
+def list_blobs(repo_path, rs_paths):
+    wanted = set(rs_paths)
+    output = subprocess.run(["git", "-C", repo_path, "ls-tree", "-r", "-z", "HEAD"],
+                            capture_output=True, check=True).stdout.decode("utf-8", "replace")
+    blobs = {}
+    for entry in output.split("\0"):
+        info, _, path = entry.partition("\t")
+        fields = info.split()
+        if len(fields) == 3 and fields[1] == "blob" and path in wanted:
+            blobs[path] = fields[2]
+    return blobs
+
+# analyzes only the files whose blob is not in blob_cache and adds up the rest
+# run_files(paths) runs rust_ffi_metrics --per-file on just those paths
+def analyze_repo_cached(repo_path, rs_paths, blob_cache, run_files):
+    try:
+        blobs = list_blobs(repo_path, rs_paths)
+    except subprocess.CalledProcessError:
+        print(f"Failed to list blobs in {repo_path}")
+        return None
+
+    cached = blob_cache.get_many(set(blobs.values()))
+    file_stats = {path: cached[sha] for path, sha in blobs.items() if sha in cached}
+    missing = [path for path, sha in blobs.items() if sha not in cached]
+    if missing:
+        data = run_files(missing)
+        if data is None:
+            return None
+        fresh = {record["file"]: record for record in data.get("files", [])}
+        blob_cache.put_many({blobs[path]: stats for path, stats in fresh.items() if path in blobs})
+        file_stats.update(fresh)
+
+    return metrics_from_stats(sum_file_stats(file_stats))
+
+# adds up per-file counts the way rust_ffi_metrics does for a whole repo
+# depth is the number of path components, as with a manifest
+def sum_file_stats(file_stats):
+    totals = dict.fromkeys(FILE_FIELDS, 0)
+    max_depth = 0
+    for path, stats in file_stats.items():
+        for field in FILE_FIELDS:
+            totals[field] += stats.get(field, 0)
+        max_depth = max(max_depth, path.count("/") + 1)
+
+    totals["total_lines"] = totals.pop("lines")
+    totals["max_depth"] = max_depth
+    return totals
+
+# long-lived rust_ffi_metrics --stdin process
+# repo paths go in one per line, optionally with a tab and a manifest,
+# and come back as one JSON line each.
+# a repo that runs past its timeout kills the process, the next repo starts a new one
+class MetricsWorker:
+    def __init__(self, rust_binary, threads=None, per_file=False, from_git=False):
+        self.rust_binary = rust_binary
+        self.threads = threads
+        self.per_file = per_file
+        self.from_git = from_git
+        self.process = None
+        self.lines = None
+
+    def start(self):
+        self.process = subprocess.Popen([self.rust_binary, "--stdin"] + metrics_args(self.threads, self.per_file, self.from_git), stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                        text=True, bufsize=1)
+        # a reader thread lets analyze() wait on the output with a timeout
+        self.lines = queue.Queue()
+        threading.Thread(target=pump_lines, args=(self.process.stdout, self.lines), daemon=True).start()
+
+    def analyze(self, repo_path, timeout=None, manifest=None):
+        if self.process is None or self.process.poll() is not None:
+            self.start()
+        request = f"{repo_path}\t{manifest}" if manifest else repo_path
+        try:
+            self.process.stdin.write(request + "\n")
+            self.process.stdin.flush()
+            line = self.lines.get(timeout=timeout)
+        except OSError:
+            line = None
+        except queue.Empty:
+            print(f"Timed out analyzing {repo_path}")
+            self.stop()
+            return None
+
+        if line is None:
+            print(f"Failed to analyze {repo_path}")
+            self.stop()
+        return line
+
+    def stop(self):
+        if self.process is None:
+            return
+        self.process.kill()
+        self.process.wait()
+        self.process = None
+
+# hands out idle MetricsWorkers to the analysis threads
+class MetricsWorkerPool:
+    def __init__(self, rust_binary, size, threads=None, per_file=False, from_git=False):
+        self.workers = [MetricsWorker(rust_binary, threads, per_file, from_git) for _ in range(size)]
+        self.idle = queue.Queue()
+        for worker in self.workers:
+            self.idle.put(worker)
+
+    def analyze(self, repo_path, timeout=None, manifest=None):
+        worker = self.idle.get()
+        try:
+            return worker.analyze(repo_path, timeout, manifest)
+        finally:
+            self.idle.put(worker)
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+
+# forwards lines from a pipe, None marks the end of the output
+def pump_lines(pipe, lines):
+    for line in pipe:
+        lines.put(line)
+    lines.put(None)
+
+def load_output(result, repo_path):
     try:
-        data = json.loads(result)
+        return json.loads(result)
     except json.JSONDecodeError:
         print(f"Invalid JSON output from rust_ffi_metrics in {repo_path}")
         return None
 
+# rust_ffi_metrics counts -> metrics dict
+def metrics_from_stats(data):
     metrics = {
         "total_lines": data.get("total_lines", 0),
         "extern_c": data.get("extern_c", 0),
@@ -127,33 +437,65 @@ def analyze_repo(repo_path, rust_binary):
 
     return metrics
 
+# .rs files per usage role (kernel, driver, sandbox, library, other), see path_rules
 def categorize_usage(rs_paths):
-    categories = {"kernel": 0, "driver": 0, "sandbox": 0, "library": 0, "other": 0}
-    for path in rs_paths:
-        if "kernel" in path:
-            categories["kernel"] += 1
-        elif "driver" in path:
-            categories["driver"] += 1
-        elif "sandbox" in path:
-            categories["sandbox"] += 1
-        elif "lib" in path:
-            categories["library"] += 1
-        else:
-            categories["other"] += 1
-    return categories
+    return default_classifier.usage(rs_paths)
 
 def average_file_depth(rs_paths):
     depths = [path.count("/") for path in rs_paths]
     return sum(depths) / len(depths) if depths else 0
 
-def analyze_json_repos(json_file, rust_binary, workspace, max_repo_size = 100, output_file = "ffi_metrics.json", max_count=10, delete_after=False):
-    os.makedirs(workspace, exist_ok=True)
-    
-    with open(json_file, "r", encoding="utf-8") as f:
-        repos = json.load(f)
+# metrics already journaled by an interrupted run, {name: metrics or None}
+# a record only counts while its clone_url and head commit in repos are unchanged
+# a run killed mid-write leaves a partial last line, which is ignored
+def read_journal(journal_file, repos):
+    done = {}
+    if not os.path.exists(journal_file):
+        return done
+    with open(journal_file, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            name = record["name"]
+            if name in repos and [record.get("clone_url"), record.get("commit")] == journal_key(repos[name]):
+                done[name] = record["metrics"]
+    return done
+
+# what a journal record has to match to stand for a repository: its clone_url and head commit
+def journal_key(info):
+    return [info.get("clone_url"), head_commit(info.get("git_branches", {}))]
+
+# opens the journal for appending, finishing off a partial last line first
+def open_journal(journal_file):
+    journal = open(journal_file, "a+", encoding="utf-8")
+    if journal.tell() > 0:
+        journal.seek(journal.tell() - 1)
+        if journal.read(1) != "\n":
+            journal.write("\n")
+    return journal
 
+# appends one repository's metrics and forces it to disk, with the journal_key of info
+# failures are journaled with null metrics so a resumed run skips them too
+def append_journal(journal, name, metrics, info):
+    clone_url, commit = journal_key(info)
+    journal.write(json.dumps({"name": name, "clone_url": clone_url, "commit": commit, "metrics": metrics}) + "\n")
+    journal.flush()
+    os.fsync(journal.fileno())
+
+def delete_repo(local_path):
+    with metrics.stage("delete"):
+        subprocess.run(["rm", "-rf", local_path])
+
+# estimated seconds to clone and analyze a repository, see CLONE_SECONDS_PER_FILE
+def estimate_seconds(info, rs_paths):
+    return CLONE_SECONDS_PER_FILE * info.get("total", 0) + PARSE_SECONDS_PER_RS_FILE * len(rs_paths)
+
+# repositories that pass the size filters, with their rs paths
+# yields (name, clone_url, rs_paths, estimated seconds) until max_count + 1 have been handed out
+def select_repos(repos, max_repo_size, max_count, cache=None):
     count = 0
-    results = {}
     for name, info in repos.items():
         if info[".rs"] <= 0:
             continue
@@ -161,41 +503,181 @@ def analyze_json_repos(json_file, rust_binary, workspace, max_repo_size = 100, o
             continue
         if count > max_count:
             break
-        
-        clone_url = info["clone_url"]
 
-        # if in rust_clones, cd rs_paths
-        rs_path_file = info["rs_path_file"]
-        currdirectory = os.getcwd()
-        while not currdirectory.endswith("analyzer"):
-            os.chdir("..")
-            currdirectory = os.getcwd()
-        rs_path_file = os.path.join(currdirectory, rs_path_file)
+        clone_url = info["clone_url"]
+        rs_path_file = os.path.join(ANALYZER_DIR, info.get("rs_path_file", ""))
         # get list of rs files in repository:
-        rs_paths = get_rs_paths(rs_path_file)
+        rs_paths = get_rs_paths(rs_path_file, clone_url, head_commit(info.get("git_branches", {})), cache)
 
         if rs_paths == None:
             continue
-        
-        
-        local_path = os.path.join(workspace, name.replace("/", "_"))  # Avoid nesting dirs
-        if clone_repo_sparse(clone_url, local_path, rs_paths):
-            metrics = analyze_repo(local_path, rust_binary)
-            if metrics:
-                metrics["usage"] = categorize_usage(rs_paths)
-                metrics["average_file_depth"] = average_file_depth(rs_paths)
-                results[name] = metrics
-
-            if delete_after:
-                subprocess.run(["rm", "-rf", local_path])
-
-        if not os.path.exists(local_path):
-            print(f"[!] Repo path does not exist after clone: {local_path}")
-        
+
+        yield name, clone_url, rs_paths, estimate_seconds(info, rs_paths)
         count += 1
 
-    with open(output_file, "w", encoding="utf-8") as out:
-        json.dump(results, out, indent=2)
+# clone -> analyze -> delete pipeline
+# clone_workers clones and analysis_workers rust_ffi_metrics runs overlap,
+# deletion runs behind them on its own thread. at most
+# clone_workers + analysis_workers checkouts are on disk at once, one waiting
+# to be deleted still counts
+# every result is appended to journal_file (<output>_journal.jsonl by default)
+# as soon as it exists, repositories already in it (at the same head commit) are
+# skipped, and output_file is written from the journal at the end, in json order,
+# after which the journal is deleted. a .jsonl
+# output_file is instead appended to as repositories finish (journaled ones first)
+# batch keeps analysis_workers rust_ffi_metrics processes alive for the whole run,
+# each repository gets timeout + timeout_per_file * (number of .rs files) seconds
+# parse_threads is passed to rust_ffi_metrics --threads, lower it when
+# analysis_workers > 1 so the processes do not fight over the cores
+# manifest hands rust_ffi_metrics the exact rs_paths list, so it skips the walk
+# blob_cache is a BlobMetricsCache, files whose blob it knows are not parsed again
+# blob_fetch makes bare blobless clones and fetches only the blobs that get parsed,
+# nothing is checked out
+# repo_store is a RepoStore, repositories are fetched into its mirrors instead of
+# cloned from scratch. with blob_fetch the mirrors are read directly and never deleted
+# schedule "largest" starts the repositories with the highest estimate_seconds first,
+# so a huge one does not start last and leave the other workers idle at the end
+# (longest processing time first). "input" keeps the json order. the output is
+# in json order either way, and each repository's estimate is printed next to
+# the time it actually took
+def analyze_json_repos(json_file, rust_binary, workspace, max_repo_size = 100, output_file = "ffi_metrics.json", max_count=10, delete_after=False, cache=None,
+                       clone_workers=1, analysis_workers=1, journal_file=None, batch=False, timeout=60, timeout_per_file=0,
+                       parse_threads=None, manifest=False, blob_cache=None, blob_fetch=False,
+                       repo_store=None, schedule="largest"):
+    os.makedirs(workspace, exist_ok=True)
+    
+    repos = load_records(json_file)
+
+    if journal_file is None:
+        journal_file = os.path.splitext(output_file)[0] + "_journal.jsonl"
+    metrics_by_name = read_journal(journal_file, repos)
+    if metrics_by_name:
+        print(f"[+] Resuming, {len(metrics_by_name)} repositories already in {journal_file}")
+
+    jobs = list(select_repos(repos, max_repo_size, max_count, cache))
+    order = [job[0] for job in jobs]
+    if schedule == "largest":
+        jobs.sort(key=lambda job: job[3], reverse=True)
+    jobs = iter(jobs)
+    # streamed output, repositories that are already journaled go first
+    stream = RecordWriter(output_file) if is_jsonl(output_file) else None
+    if stream:
+        for name in order:
+            if metrics_by_name.get(name):
+                stream.write(name, metrics_by_name[name])
+    in_flight_limit = clone_workers + analysis_workers
+    per_file = blob_cache is not None
+    metrics_workers = MetricsWorkerPool(rust_binary, analysis_workers, parse_threads, per_file, blob_fetch) if batch else None
+    clone = clone_repo_blobless if blob_fetch else clone_repo_sparse
+    if repo_store:
+        clone = partial(mirror_from_store if blob_fetch else clone_from_store, repo_store)
+    # mirrors outlive the run, only checkouts are deleted
+    keep_clones = repo_store is not None and blob_fetch
+
+    # runs rust_ffi_metrics on local_path, limited to paths when given
+    def run_files(local_path, paths, file_count):
+        repo_timeout = timeout + timeout_per_file * file_count
+        manifest_file = None
+        if paths is not None:
+            # next to the clone, not inside it, so it is never mistaken for repo content
+            manifest_file = local_path + ".rs_paths.txt"
+            with open(manifest_file, "w", encoding="utf-8") as f:
+                f.write("\n".join(paths) + "\n")
+        try:
+            if blob_fetch:
+                fetch_blobs(local_path, paths)
+            if metrics_workers:
+                return run_metrics_batched(local_path, metrics_workers, repo_timeout, manifest_file)
+            return run_metrics(local_path, rust_binary, repo_timeout, parse_threads, manifest_file, per_file, blob_fetch)
+        finally:
+            if manifest_file:
+                os.remove(manifest_file)
+
+    def run_analysis(local_path, rs_paths):
+        if blob_cache:
+            return analyze_repo_cached(local_path, rs_paths, blob_cache,
+                                       lambda paths: run_files(local_path, paths, len(paths)))
+        # a blobless clone has no tree to walk, and only the listed blobs are fetched
+        data = run_files(local_path, rs_paths if manifest or blob_fetch else None, len(rs_paths))
+        return metrics_from_stats(data) if data else None
+    pending = {}
+    estimated_total = 0
+    actual_total = 0
+    run_started = time.monotonic()
+
+    with open_journal(journal_file) as journal, \
+         ThreadPoolExecutor(clone_workers) as clone_pool, \
+         ThreadPoolExecutor(analysis_workers) as analysis_pool, \
+         ThreadPoolExecutor(1) as delete_pool:
+
+        def start_clones():
+            while len(pending) < in_flight_limit:
+                job = next(jobs, None)
+                if job is None:
+                    return
+                name, clone_url, rs_paths, estimate = job
+                if name in metrics_by_name:
+                    continue
+                local_path = os.path.join(workspace, name.replace("/", "_"))  # Avoid nesting dirs
+                if keep_clones:
+                    local_path = repo_store.mirror_path(clone_url)
+                # stages on the pool threads are charged to this repository
+                future = clone_pool.submit(metrics.run_in_repo, name,
+                                           clone, clone_url, local_path, rs_paths)
+                pending[future] = ("clone", name, local_path, rs_paths, estimate)
+
+        start_clones()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, name, local_path, rs_paths, estimate = pending.pop(future)
+                if stage == "delete":
+                    continue
+                if stage == "clone":
+                    if future.result():
+                        pending[analysis_pool.submit(metrics.run_in_repo, name,
+                                                     run_analysis, local_path, rs_paths)] = \
+                            ("analyze", name, local_path, rs_paths, estimate)
+                    elif not os.path.exists(local_path):
+                        print(f"[!] Repo path does not exist after clone: {local_path}")
+                    continue
+
+                repo_metrics = future.result()
+                # time spent cloning and analyzing it on the workers, not waiting in their queues
+                took = metrics.repo_time(name)
+                estimated_total += estimate
+                actual_total += took
+                print(f"[+] {name}: estimated {estimate:.1f}s, took {took:.1f}s")
+                if repo_metrics:
+                    repo_metrics["usage"] = categorize_usage(rs_paths)
+                    repo_metrics["average_file_depth"] = average_file_depth(rs_paths)
+                metrics_by_name[name] = repo_metrics
+                append_journal(journal, name, repo_metrics, repos[name])
+                if stream and repo_metrics:
+                    stream.write(name, repo_metrics)
+                if delete_after and not keep_clones:
+                    # stays in pending until it is gone, so the checkout counts toward in_flight_limit
+                    pending[delete_pool.submit(metrics.run_in_repo, name, delete_repo, local_path)] = \
+                        ("delete", name, local_path, rs_paths, estimate)
+            start_clones()
+
+    if metrics_workers:
+        metrics_workers.close()
+    if actual_total:
+        print(f"[+] Estimated {estimated_total:.1f}s of work, measured {actual_total:.1f}s "
+              f"in {time.monotonic() - run_started:.1f}s wall time")
+
+    count = len(order)
+    if stream:
+        stream.close()
+    else:
+        # keep the input order no matter which repository finished first
+        with RecordWriter(output_file, indent=2) as out:
+            for name in order:
+                if metrics_by_name.get(name):
+                    out.write(name, metrics_by_name[name])
+    # the run is complete and in output_file, the next one starts fresh
+    os.remove(journal_file)
 
     print(f"✅ Done analyzing {count} repositories.")
     print(f"wrote to {os.getcwd()},{output_file}")
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+# aggregate statistics over a metrics table (metrics_store.load_metrics),
+# one vectorized pass per statistic instead of a Python loop over repositories.
+# every function returns its result rather than printing it
+
+FFI_COLUMNS = ["extern_c", "no_mangle", "link_attrs"]
+USAGE_CATEGORIES = ["kernel", "driver", "library", "sandbox"]
+
+
+# column as int64, zeros when the table does not have it
+def counts(df, column):
+    if column not in df.columns:
+        return pd.Series(0, index=df.index, dtype=np.int64)
+    return df[column].fillna(0).astype(np.int64)
+
+
+# repositories with at least one of each ffi marker
+# DataFrame indexed by marker: projects, percent
+def ffi_usage(df, columns=FFI_COLUMNS):
+    projects = pd.Series({column: int((counts(df, column) > 0).sum()) for column in columns})
+    return pd.DataFrame({
+        "projects": projects,
+        "percent": projects / len(df) * 100 if len(df) else 0.0,
+    })
+
+
+# min, max and mean syntax tree height, plus how many repositories have each height
+def tree_height_stats(df, column="syntax_tree_height"):
+    heights = counts(df, column).to_numpy()
+    if not len(heights):
+        return {"min": 0, "max": 0, "mean": 0.0, "histogram": pd.Series(dtype=np.int64)}
+    low = int(heights.min())
+    histogram = np.bincount(heights - low)
+    return {
+        "min": low,
+        "max": int(heights.max()),
+        "mean": float(heights.mean()),
+        "histogram": pd.Series(histogram, index=np.arange(low, low + len(histogram))),
+    }
+
+
+# .rs files per usage category summed over all repositories
+# DataFrame indexed by category: files, percent of the files in these categories
+def usage_distribution(df, categories=USAGE_CATEGORIES):
+    files = pd.Series({category: int(counts(df, category).sum()) for category in categories})
+    total = files.sum()
+    return pd.DataFrame({
+        "files": files,
+        "percent": files / total * 100 if total else 0.0,
+    })
+
+
+# for each usage category, how many repositories have files in it and how many
+# of those use any ffi marker. rate is NaN for a category with no repositories
+def ffi_by_category(df, categories=USAGE_CATEGORIES, ffi_columns=FFI_COLUMNS):
+    uses_ffi = sum(counts(df, column) for column in ffi_columns).to_numpy() > 0
+    in_category = np.column_stack([counts(df, category).to_numpy() > 0 for category in categories]) \
+        if len(categories) else np.zeros((len(df), 0), dtype=bool)
+    projects = in_category.sum(axis=0)
+    ffi_projects = (in_category & uses_ffi[:, None]).sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = np.where(projects > 0, ffi_projects / projects, np.nan)
+    return pd.DataFrame({"projects": projects, "ffi_projects": ffi_projects, "rate": rate}, index=categories)
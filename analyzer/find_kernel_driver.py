@@ -1,7 +1,9 @@
 import pandas as pd
+import _root
+from metrics_store import load_metrics
 
-# Load the data
-df = pd.read_csv("ffi_metrics_cleaned.csv", index_col=0)
+# Load the data, the same table as ffi_metrics_cleaned.csv without re-parsing text
+df = load_metrics("ffi_metrics.json")
 
 # Separate kernel and driver matches
 kernel_df = df[df.index.str.contains("kernel", case=False)].sort_values(by="total_lines", ascending=False)
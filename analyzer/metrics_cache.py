@@ -0,0 +1,62 @@
+import sqlite3
+import threading
+import time
+
+# per-file counts rust_ffi_metrics --per-file reports, in column order
+FILE_FIELDS = ["lines", "extern_c", "link_attr", "no_mangle", "unsafe_count", "unsafe_fn_count", "ffi_file_count"]
+
+
+# persistent rust_ffi_metrics results per file, keyed by git blob sha
+# the same blob always parses to the same counts, so a file only has to be
+# parsed once across runs and repositories. depth depends on where the file
+# sits, not on its content, so it is not stored here.
+# bounded by max_entries, least recently used blobs are evicted first
+class BlobMetricsCache:
+    def __init__(self, path, max_entries=1000000):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        columns = ", ".join(f"{field} INTEGER NOT NULL" for field in FILE_FIELDS)
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS blobs (sha TEXT PRIMARY KEY, {columns}, last_used REAL NOT NULL)")
+        self.db.commit()
+
+    # {sha: {field: count}} for the shas that are cached
+    def get_many(self, shas):
+        shas = list(shas)
+        found = {}
+        now = time.time()
+        with self.lock:
+            # stay under sqlite's bound parameter limit
+            for start in range(0, len(shas), 500):
+                chunk = shas[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self.db.execute(f"SELECT sha, {', '.join(FILE_FIELDS)} FROM blobs WHERE sha IN ({marks})",
+                                       chunk).fetchall()
+                for row in rows:
+                    found[row[0]] = dict(zip(FILE_FIELDS, row[1:]))
+                self.db.execute(f"UPDATE blobs SET last_used = ? WHERE sha IN ({marks})", [now] + chunk)
+            self.db.commit()
+        return found
+
+    # stores {sha: {field: count}}
+    def put_many(self, stats_by_sha):
+        now = time.time()
+        rows = [[sha] + [stats.get(field, 0) for field in FILE_FIELDS] + [now]
+                for sha, stats in stats_by_sha.items()]
+        marks = ",".join("?" * (len(FILE_FIELDS) + 2))
+        with self.lock:
+            self.db.executemany(f"INSERT OR REPLACE INTO blobs VALUES ({marks})", rows)
+            self.db.commit()
+
+    # drops the least recently used blobs beyond max_entries
+    def evict(self):
+        with self.lock:
+            self.db.execute("DELETE FROM blobs WHERE sha IN "
+                            "(SELECT sha FROM blobs ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                            (self.max_entries,))
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
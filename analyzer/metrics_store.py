@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# record_io sits in the repository root, scripts import _root first to put it on sys.path
+from record_io import iter_records
+
+# analyzer output converted once into a columnar store: a folder next to the
+# metrics file with one .npy array per column, "usage" already flattened into
+# its own columns, and a meta.json that records which source it was built from.
+# the arrays are memory mapped copy-on-write on load, and every numeric column of
+# the DataFrame is a view of its own map, so nothing is parsed or copied until a
+# script touches a column (string columns become python objects, those are
+# copied). writes to the frame stay in memory, never in the store. the store is rebuilt only when the source changes:
+# same mtime and size is trusted, otherwise the source's sha256 decides
+
+STORE_VERSION = 1
+
+
+# "ffi_metrics.json" -> "ffi_metrics.columns"
+def store_path(source):
+    return os.path.splitext(source)[0] + ".columns"
+
+
+# (names, {column: array}, usage column names), columns in first-seen order
+# numeric columns are int64, or float64 when a value is missing or fractional,
+# anything else is a unicode string column
+def load_columns(source="ffi_metrics.json", store_dir=None):
+    store_dir = store_dir or store_path(source)
+    meta = read_meta(store_dir)
+    if not is_current(meta, source, store_dir):
+        meta = build_store(source, store_dir)
+
+    names = np.load(os.path.join(store_dir, "names.npy"), mmap_mode="c")
+    columns = {column: np.load(os.path.join(store_dir, f"{index}.npy"), mmap_mode="c")
+               for index, column in enumerate(meta["columns"])}
+    return names, columns, meta["usage_columns"]
+
+
+# the metrics as a DataFrame indexed by repository name, with usage joined in
+# as columns. df.attrs["usage_columns"] names the columns that came from usage
+def load_metrics(source="ffi_metrics.json", store_dir=None):
+    names, columns, usage_columns = load_columns(source, store_dir)
+    index = pd.Index(names)
+    # one Series per column joined side by side: pd.DataFrame(columns) would
+    # consolidate same-typed columns into one block and copy them all
+    series = [pd.Series(values, index=index, name=column, copy=False) for column, values in columns.items()]
+    df = pd.concat(series, axis=1) if series else pd.DataFrame(index=index)
+    df.attrs["usage_columns"] = usage_columns
+    return df
+
+
+# converts source into store_dir and returns its meta
+# written to a temporary folder and renamed, so readers never see half a store
+def build_store(source, store_dir):
+    names = []
+    values = {}
+    usage_columns = []
+    for row, (name, metrics) in enumerate(iter_records(source)):
+        names.append(name)
+        flat = {key: value for key, value in metrics.items() if key != "usage"}
+        for key, value in (metrics.get("usage") or {}).items():
+            flat[key] = value
+            if key not in usage_columns:
+                usage_columns.append(key)
+        for key, value in flat.items():
+            if isinstance(value, (dict, list)):
+                continue
+            # a column first seen late is missing for every earlier row
+            values.setdefault(key, [None] * row).append(value)
+        for key, column in values.items():
+            if len(column) <= row:
+                column.append(None)
+
+    temp_dir = store_dir + ".tmp"
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    np.save(os.path.join(temp_dir, "names.npy"), np.array(names, dtype=str))
+    for index, column in enumerate(values.values()):
+        np.save(os.path.join(temp_dir, f"{index}.npy"), column_array(column))
+
+    stat = os.stat(source)
+    meta = {
+        "version": STORE_VERSION,
+        "source_mtime_ns": stat.st_mtime_ns,
+        "source_size": stat.st_size,
+        "source_sha256": file_sha256(source),
+        "columns": list(values),
+        "usage_columns": usage_columns,
+    }
+    with open(os.path.join(temp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    shutil.rmtree(store_dir, ignore_errors=True)
+    os.replace(temp_dir, store_dir)
+    return meta
+
+
+# smallest numpy type that holds every value of a column
+def column_array(column):
+    present = [value for value in column if value is not None]
+    if present and all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in present):
+        if len(present) == len(column) and all(isinstance(value, int) for value in present):
+            return np.array(column, dtype=np.int64)
+        return np.array([np.nan if value is None else value for value in column], dtype=np.float64)
+    return np.array(["" if value is None else str(value) for value in column], dtype=str)
+
+
+def read_meta(store_dir):
+    try:
+        with open(os.path.join(store_dir, "meta.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+# whether the store in meta was built from the current contents of source
+# a touched but unchanged source gets its new mtime recorded instead of a rebuild
+def is_current(meta, source, store_dir):
+    if not meta or meta.get("version") != STORE_VERSION:
+        return False
+    stat = os.stat(source)
+    if meta["source_mtime_ns"] == stat.st_mtime_ns and meta["source_size"] == stat.st_size:
+        return True
+    if meta["source_size"] != stat.st_size or meta["source_sha256"] != file_sha256(source):
+        return False
+    meta["source_mtime_ns"] = stat.st_mtime_ns
+    with open(os.path.join(store_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return True
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -1,26 +1,15 @@
 import os
 from collections import defaultdict, Counter
+from concurrent.futures import ProcessPoolExecutor
 import matplotlib.pyplot as plt
 
+from path_rules import NORMALIZATION_MAP, classify_file
+
 # Directory of .txt files
 rust_paths_dir = os.path.join(os.getcwd(), "rs_paths")
 
-# Manual normalization mappings (fuzzy grouping)
-normalization_map = {
-    "lib": "library",
-    "libs": "library",
-    "library": "library",
-    "driver": "driver",
-    "drivers": "driver",
-    "drv": "driver",
-    "kernel": "kernel",
-    "core": "core",
-    "hal": "hardware",
-    "hw": "hardware"
-}
-
 # Explicit categories to track
-tracked_categories = set(normalization_map.values())
+tracked_categories = set(NORMALIZATION_MAP.values())
 
 # For analysis
 category_repos = defaultdict(set)
@@ -34,36 +23,28 @@ excluded_segments = {
 included_segments = {"library", "driver", "kernel"}
 repo_total = 0
 
-def normalize_segment(segment):
-    segment = segment.lower()
-    return normalization_map.get(segment, segment)
-
-# Process each repo
-for file in os.listdir(rust_paths_dir):
-    if file.endswith(".txt"):
-        repo_total += 1
-        repo_name = file
-        with open(os.path.join(rust_paths_dir, file), "r") as f:
-            paths = [line.strip() for line in f if line.strip().endswith(".rs")]
-        
-        seen_segments = set()
-        for path in paths:
-            segments = set(normalize_segment(p) for p in path.lower().split("/"))
-            seen_segments.update(segments)
-        
-        for seg in seen_segments:
-            segment_counter[seg] += 1
-            if seg in tracked_categories:
-                category_repos[seg].add(repo_name)
+# Process each repo, rs_paths files are classified in parallel by path_rules
+def classify_repos():
+    global repo_total
+    files = sorted(file for file in os.listdir(rust_paths_dir) if file.endswith(".txt"))
+    with ProcessPoolExecutor() as pool:
+        results = pool.map(classify_file, [os.path.join(rust_paths_dir, file) for file in files], chunksize=16)
+        for repo_name, (usage, seen_segments) in zip(files, results):
+            repo_total += 1
+            for seg in seen_segments:
+                segment_counter[seg] += 1
+                if seg in tracked_categories:
+                    category_repos[seg].add(repo_name)
 
 # Output to file
-with open("rust_paths_classification.txt", "w") as out:
-    out.write(f"Total repositories processed: {repo_total}\n\n")
-    for cat in tracked_categories:
-        out.write(f"Repositories using '{cat}': {len(category_repos[cat])}\n")
-    out.write("\nTop 30 normalized directory segments:\n")
-    for seg, count in segment_counter.most_common(30):
-        out.write(f"{seg}: {count}\n")
+def write_classification():
+    with open("rust_paths_classification.txt", "w") as out:
+        out.write(f"Total repositories processed: {repo_total}\n\n")
+        for cat in tracked_categories:
+            out.write(f"Repositories using '{cat}': {len(category_repos[cat])}\n")
+        out.write("\nTop 30 normalized directory segments:\n")
+        for seg, count in segment_counter.most_common(30):
+            out.write(f"{seg}: {count}\n")
 
 # Plotting
 def plot_top_segments(n=15, exclude=excluded_segments, include=included_segments):
@@ -99,7 +80,14 @@ def plot_included_segments(included=included_segments):
     plt.show()
 
 
-# Run graph generation
-plot_top_segments(n=15)
-plot_included_segments()
-print(repo_total)
+def main():
+    classify_repos()
+    write_classification()
+    # Run graph generation
+    plot_top_segments(n=15)
+    plot_included_segments()
+    print(repo_total)
+
+# worker processes import this file again, they must not rerun the script
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import re
+
+# one classifier for rs_paths, shared by path_classification.py (directory
+# segment histogram) and analyzer.categorize_usage (usage role per file).
+# both come out of the same pass over a repository's paths. work is memoized
+# per path component and per directory prefix, so a directory holding a
+# thousand files is looked at once, not a thousand times
+
+# Manual normalization mappings (fuzzy grouping)
+NORMALIZATION_MAP = {
+    "lib": "library",
+    "libs": "library",
+    "library": "library",
+    "driver": "driver",
+    "drivers": "driver",
+    "drv": "driver",
+    "kernel": "kernel",
+    "core": "core",
+    "hal": "hardware",
+    "hw": "hardware"
+}
+
+# usage role -> substring that marks it, earlier roles win when a path has several
+USAGE_KEYWORDS = {
+    "kernel": "kernel",
+    "driver": "driver",
+    "sandbox": "sandbox",
+    "library": "lib",
+}
+
+
+class PathClassifier:
+    def __init__(self, normalization_map=NORMALIZATION_MAP, usage_keywords=USAGE_KEYWORDS):
+        self.normalization_map = normalization_map
+        self.categories = list(usage_keywords) + ["other"]
+        self.other = len(usage_keywords)
+        self.keyword_rank = {keyword: rank for rank, keyword in enumerate(usage_keywords.values())}
+        # every keyword in a component in one search, the lookahead lets overlapping ones match too
+        self.keywords = re.compile("(?=(" + "|".join(re.escape(k) for k in usage_keywords.values()) + "))")
+        self.component_ranks = {}
+        self.dir_ranks = {"": self.other}
+        self.normalized = {}
+
+    # lowercased segment, with the fuzzy grouping applied
+    def normalize(self, segment):
+        normalized = self.normalized.get(segment)
+        if normalized is None:
+            lower = segment.lower()
+            normalized = self.normalization_map.get(lower, lower)
+            self.normalized[segment] = normalized
+        return normalized
+
+    # best (lowest) usage rank of any keyword inside one path component
+    # keywords never contain "/", so a path's rank is the best of its components
+    def component_rank(self, component):
+        rank = self.component_ranks.get(component)
+        if rank is None:
+            ranks = [self.keyword_rank[keyword] for keyword in self.keywords.findall(component)]
+            rank = min(ranks, default=self.other)
+            self.component_ranks[component] = rank
+        return rank
+
+    # usage rank of a directory, from its parent's so each prefix is ranked once
+    def dir_rank(self, directory):
+        rank = self.dir_ranks.get(directory)
+        if rank is None:
+            parent, _, name = directory.rpartition("/")
+            rank = min(self.dir_rank(parent), self.component_rank(name))
+            self.dir_ranks[directory] = rank
+        return rank
+
+    # ({usage role: file count}, set of normalized segments) for one repository
+    # a file goes to the first role whose keyword appears anywhere in its path
+    def classify(self, paths):
+        usage = [0] * len(self.categories)
+        segments = set()
+        seen_dirs = {""}
+        for path in paths:
+            directory, _, name = path.rpartition("/")
+            usage[min(self.dir_rank(directory), self.component_rank(name))] += 1
+            segments.add(self.normalize(name))
+            # only directories this repository has not shown yet add segments
+            while directory not in seen_dirs:
+                seen_dirs.add(directory)
+                directory, _, part = directory.rpartition("/")
+                segments.add(self.normalize(part))
+        return dict(zip(self.categories, usage)), segments
+
+    def usage(self, paths):
+        return self.classify(paths)[0]
+
+
+# one per process, its memo tables are reused for every repository
+default_classifier = PathClassifier()
+
+
+# classify() of the .rs paths in an rs_paths file, for process pools
+def classify_file(filename):
+    with open(filename, "r") as f:
+        paths = [line.strip() for line in f if line.strip().endswith(".rs")]
+    return default_classifier.classify(paths)
@@ -0,0 +1,75 @@
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+
+
+# persistent bare blobless mirrors, one per clone url, shared by every run
+# a mirror is cloned once and after that only brought up to date with
+# git fetch, so a re-analysis moves just the new commits, trees and the
+# blobs that are actually read. bounded by max_bytes on disk, the mirrors
+# used longest ago are evicted first
+class RepoStore:
+    def __init__(self, root, max_bytes=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    # readable name plus a hash of the url, so two hosts with the same repo name do not collide
+    def mirror_path(self, clone_url):
+        name = re.sub(r"[^A-Za-z0-9._-]+", "_", clone_url.rstrip("/").split("/")[-1])
+        digest = hashlib.sha1(clone_url.encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.root, f"{name}-{digest}.git")
+
+    # clones or fetches the mirror of clone_url, returns its path or None
+    # HEAD follows the remote's default branch, nothing else is fetched
+    def update(self, clone_url):
+        path = self.mirror_path(clone_url)
+        try:
+            if not os.path.isdir(path):
+                subprocess.run(["git", "clone", "--bare", "--single-branch", "--filter=blob:none", clone_url, path],
+                               check=True)
+                print(f"[+] Mirrored: {clone_url}")
+            else:
+                branch = subprocess.run(["git", "-C", path, "symbolic-ref", "HEAD"],
+                                        capture_output=True, text=True, check=True).stdout.strip()
+                subprocess.run(["git", "-C", path, "fetch", "--no-tags", "--filter=blob:none", "origin",
+                                f"+HEAD:{branch}"], check=True)
+                # worktrees of earlier runs that were deleted without git knowing
+                subprocess.run(["git", "-C", path, "worktree", "prune"], check=True)
+                print(f"[+] Fetched into mirror: {clone_url}")
+            # the directory mtime is the last use, for eviction
+            os.utime(path)
+            return path
+        except (subprocess.CalledProcessError, OSError):
+            print(f"[!] Failed to update mirror: {clone_url}")
+            return None
+
+    # removes least recently used mirrors until the store fits in max_bytes
+    # run it between runs, not while mirrors are being read
+    def evict(self):
+        if not self.max_bytes:
+            return
+        mirrors = []
+        for entry in os.scandir(self.root):
+            if entry.is_dir() and entry.name.endswith(".git"):
+                mirrors.append((entry.stat().st_mtime, entry.path, directory_size(entry.path)))
+        total = sum(size for _, _, size in mirrors)
+        for _, path, size in sorted(mirrors):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            print(f"[+] Evicted mirror: {path}")
+
+
+def directory_size(path):
+    size = 0
+    for folder, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(folder, name)).st_size
+            except OSError:
+                pass
+    return size
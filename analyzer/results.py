@@ -1,18 +1,16 @@
-import json
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 from sklearn.decomposition import PCA
 from sklearn.preprocessing import StandardScaler
-
-# Load JSON
-with open('ffi_metrics.json', 'r') as f:
-    data = json.load(f)
-
-# Convert to DataFrame
-df = pd.DataFrame.from_dict(data, orient='index')
-usage_df = df['usage'].apply(pd.Series)
-df = df.drop(columns=['usage']).join(usage_df)
+import sys
+import _root
+from metrics_store import load_metrics
+
+# Load the metrics (.json or .jsonl) through the columnar store, usage is already flattened
+metrics_file = sys.argv[1] if len(sys.argv) > 1 else 'ffi_metrics.json'
+df = load_metrics(metrics_file)
+usage_df = df[df.attrs['usage_columns']]
 
 # Summary table
 summary_stats = df.describe().loc[['mean', '50%', 'max']].rename(index={'50%': 'median'})
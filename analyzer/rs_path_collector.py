@@ -1,54 +1,78 @@
-import requests
-import json
 import subprocess
-import sys
 import os
-from urllib.parse import urljoin
+import argparse
+
+import _root
+from archive_scan import archive_listing, head_commit, scan_listing
+from scrape_cache import ScrapeCache
+from record_io import RecordWriter, is_jsonl, iter_records
+import pipeline_metrics
+from pipeline_metrics import metrics
 
 def main():
-    input_file, output_file = in_out_filenames('_output.json')
+    args = parse_args()
+    if args.trace:
+        metrics.enable_trace()
+    # a .jsonl input gets a .jsonl output unless the output is named
+    input_file, output_file = in_out_filenames('_output.jsonl' if is_jsonl(args.input_file) else '_output.json',
+                                               args.input_file, args.output_file)
     rs_path_dir = "rs_paths"
     os.makedirs(rs_path_dir, exist_ok=True)
 
-    with open(input_file, 'r') as f:
-        data = json.load(f)
+    # optional third argument: the scraper's cache file, listings in it are not downloaded again
+    cache = ScrapeCache(args.cache) if args.cache else None
 
-    for repo_name, repo_info in data.items():
+    # repositories are read and written one at a time, with .jsonl files
+    # only the current one is in memory
+    writer = RecordWriter(output_file)
+    for repo_name, repo_info in iter_records(input_file):
         if repo_info.get(".rs", 0) <= 0:
+            writer.write(repo_name, repo_info)
             continue
 
-        rs_paths = collect_rs_file_paths(repo_info["clone_url"])
         repo_id = repo_name.replace("/", "_")
         rs_path_file = os.path.join(rs_path_dir, repo_id + ".txt")
 
-        with open(rs_path_file, "w") as out:
-            for path in rs_paths:
-                out.write(path + "\n")
+        # paths are written as they stream in from the archive,
+        # the .rs count from the same pass is kept up to date as well
+        commit = head_commit(repo_info.get("git_branches", {}))
+        try:
+            with metrics.repo(repo_name):
+                rs_paths = collect_rs_file_paths(repo_info["clone_url"], commit, cache)
+                _, counts, written = scan_listing(rs_paths, [".rs"], rs_path_file)
+        except subprocess.CalledProcessError:
+            print(f"[!] Failed to list archive: {repo_info['clone_url']}")
+            writer.write(repo_name, repo_info)
+            continue
+        repo_info[".rs"] = counts[".rs"]
+        if written:
+            repo_info["rs_path_file"] = rs_path_file
+        writer.write(repo_name, repo_info)
 
-        repo_info["rs_path_file"] = rs_path_file
+    writer.close()
+    if cache:
+        cache.close()
 
-    update_json_file(data, output_file)
+    metrics.report(args.metrics, args.trace)
 
-def collect_rs_file_paths(repo_url):
-    archive_url = repo_url + "/+archive/HEAD.tar.gz"
-    cmd = ['curl', '-L', archive_url]
-    tar_cmd = ['tar', '-tzf', '-']
+# .rs paths in the repository's archive at commit (default HEAD), as they stream in
+def collect_rs_file_paths(repo_url, commit=None, cache=None):
+    for path in archive_listing(repo_url, commit, cache):
+        if path.endswith(".rs"):
+            yield path
 
-    curl = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-    tar = subprocess.Popen(tar_cmd, stdin=curl.stdout, stdout=subprocess.PIPE, text=True)
-    file_list, _ = tar.communicate()
-    return [f for f in file_list.strip().split("\n") if f.endswith(".rs")]
+def parse_args():
+    parser = argparse.ArgumentParser(description="write the .rs paths of each repository to rs_paths/")
+    parser.add_argument("input_file", help="pyscraper output with clone_url and .rs attributes")
+    parser.add_argument("output_file", nargs="?", default=None, help="default <input>_output.json")
+    parser.add_argument("cache", nargs="?", default=None, help="pyscraper --cache file")
+    pipeline_metrics.add_arguments(parser)
+    return parser.parse_args()
 
-def in_out_filenames(output_ext):
-    input_file = sys.argv[1]
+def in_out_filenames(output_ext, input_file, output_file=None):
     root = os.path.splitext(input_file)[0]
-    output_file = root + output_ext
-    if len(sys.argv) > 2:
-        output_file = sys.argv[2]
+    if output_file is None:
+        output_file = root + output_ext
     return input_file, output_file
 
-def update_json_file(data, filename):
-    with open(filename, 'w') as f:
-        json.dump(data, f, indent=4)
-
 main()
@@ -1,6 +1,11 @@
-use std::{env, fs};
-use std::path::Path;
-use syn::{Item, Attribute, File};
+use std::{env, fs, thread};
+use std::io::{self, BufRead, BufReader, Read, Write};
+use std::path::{Path, PathBuf};
+use std::process::{Command, Stdio};
+use std::sync::atomic::{AtomicUsize, Ordering};
+use std::sync::mpsc::sync_channel;
+use std::sync::Mutex;
+use syn::{Item, Attribute};
 use walkdir::WalkDir;
 use serde::Serialize;
 
@@ -15,6 +20,32 @@ struct RepoStats {
     ffi_file_count: usize,
     max_depth: usize,
     classification: String,
+    // Per-file counts, only with --per-file
+    #[serde(skip_serializing_if = "Option::is_none")]
+    files: Option<Vec<FileRecord>>,
+}
+
+// One file of --per-file output, the path is relative to the repo root
+#[derive(Serialize)]
+struct FileRecord {
+    file: String,
+    #[serde(flatten)]
+    stats: FileStats,
+}
+
+// Command line switches that apply to every repo
+struct Options {
+    threads: usize,
+    per_file: bool,
+    from_git: bool,
+}
+
+// One line of batch output: the repo path followed by its stats
+#[derive(Serialize)]
+struct BatchRecord<'a> {
+    path: &'a str,
+    #[serde(flatten)]
+    stats: RepoStats,
 }
 
 fn get_attrs(item: &Item) -> &[Attribute] {
@@ -32,97 +63,443 @@ fn get_attrs(item: &Item) -> &[Attribute] {
     }
 }
 
-fn analyze_repo(repo_path: &str) -> RepoStats {
-    let mut total_lines = 0;
-    let mut extern_c = 0;
-    let mut link_attr = 0;
-    let mut no_mangle = 0;
-    let mut unsafe_count = 0;
-    let mut unsafe_fn_count = 0;
-    let mut ffi_file_count = 0;
-    let mut max_depth = 0;
+// Counts for a single file, or a sum of them once merged
+#[derive(Default, Clone, Copy, Serialize)]
+struct FileStats {
+    lines: usize,
+    extern_c: usize,
+    link_attr: usize,
+    no_mangle: usize,
+    unsafe_count: usize,
+    unsafe_fn_count: usize,
+    ffi_file_count: usize,
+    max_depth: usize,
+}
+
+impl FileStats {
+    // Sums and a max, so the merge order does not change the result
+    fn merge(&mut self, other: &FileStats) {
+        self.lines += other.lines;
+        self.extern_c += other.extern_c;
+        self.link_attr += other.link_attr;
+        self.no_mangle += other.no_mangle;
+        self.unsafe_count += other.unsafe_count;
+        self.unsafe_fn_count += other.unsafe_fn_count;
+        self.ffi_file_count += other.ffi_file_count;
+        self.max_depth = self.max_depth.max(other.max_depth);
+    }
+}
+
+fn analyze_source(content: &str, depth: usize) -> FileStats {
+    let mut stats = FileStats {
+        lines: content.lines().count(),
+        max_depth: depth,
+        ..FileStats::default()
+    };
+
+    let parsed = match syn::parse_file(content) {
+        Ok(p) => p,
+        Err(_) => return stats,
+    };
+
+    let mut file_has_ffi = false;
+
+    for item in &parsed.items {
+        if let Item::ForeignMod(fm) = &item {
+            if fm.abi.name.as_ref().map(|n| n.value() == "C").unwrap_or(false) {
+                stats.extern_c += 1;
+                file_has_ffi = true;
+            }
+        }
+        if let Item::Fn(f) = &item {
+            if f.sig.unsafety.is_some() {
+                stats.unsafe_fn_count += 1;
+                file_has_ffi = true;
+            }
+        }
+        for attr in get_attrs(item) {
+            if attr.path().is_ident("link") {
+                stats.link_attr += 1;
+                file_has_ffi = true;
+            }
+            if attr.path().is_ident("no_mangle") {
+                stats.no_mangle += 1;
+                file_has_ffi = true;
+            }
+        }
+    }
+
+    // Count unsafe blocks
+    stats.unsafe_count += content.matches("unsafe {").count(); // Fast and simple heuristic
+    if content.contains("unsafe") {
+        file_has_ffi = true;
+    }
+
+    if file_has_ffi {
+        stats.ffi_file_count = 1;
+    }
+
+    stats
+}
+
+fn analyze_file(path: &Path, depth: usize) -> FileStats {
+    let content = match fs::read_to_string(path) {
+        Ok(c) => c,
+        // A manifest can list files that were not checked out
+        Err(e) if e.kind() == io::ErrorKind::NotFound => return FileStats::default(),
+        Err(_) => String::new(),
+    };
+    analyze_source(&content, depth)
+}
+
+// Parses files on `threads` threads, each pulls the next unclaimed file
+// and keeps a running total, the totals are merged at the end.
+// With per_file the individual stats are also returned, in file order
+fn analyze_files(files: &[(PathBuf, usize)], threads: usize, per_file: bool) -> (FileStats, Vec<FileStats>) {
+    let mut totals = FileStats::default();
+    if threads <= 1 || files.len() < 2 {
+        let mut each = vec![];
+        for (path, depth) in files {
+            let stats = analyze_file(path, *depth);
+            totals.merge(&stats);
+            if per_file {
+                each.push(stats);
+            }
+        }
+        return (totals, each);
+    }
+
+    let next = AtomicUsize::new(0);
+    let mut indexed: Vec<(usize, FileStats)> = vec![];
+    thread::scope(|scope| {
+        let handles: Vec<_> = (0..threads.min(files.len()))
+            .map(|_| {
+                thread::Builder::new()
+                    // syn recurses deeply on big files, match the main thread's stack
+                    .stack_size(8 * 1024 * 1024)
+                    .spawn_scoped(scope, || {
+                        let mut partial = FileStats::default();
+                        let mut each = vec![];
+                        loop {
+                            let i = next.fetch_add(1, Ordering::Relaxed);
+                            if i >= files.len() {
+                                break;
+                            }
+                            let stats = analyze_file(&files[i].0, files[i].1);
+                            partial.merge(&stats);
+                            if per_file {
+                                each.push((i, stats));
+                            }
+                        }
+                        (partial, each)
+                    })
+                    .unwrap()
+            })
+            .collect();
+        for handle in handles {
+            let (partial, each) = handle.join().unwrap();
+            totals.merge(&partial);
+            indexed.extend(each);
+        }
+    });
+    indexed.sort_by_key(|(i, _)| *i);
+    (totals, indexed.into_iter().map(|(_, stats)| stats).collect())
+}
 
-    for entry in WalkDir::new(repo_path)
+// Every .rs file under the repo, with its depth below the root
+fn walk_files(repo_path: &str) -> Vec<(PathBuf, usize)> {
+    WalkDir::new(repo_path)
         .into_iter()
         .filter_map(Result::ok)
         .filter(|e| e.path().extension().map(|ext| ext == "rs").unwrap_or(false))
+        .map(|e| (e.path().to_path_buf(), e.depth()))
+        .collect()
+}
+
+// Files listed in a manifest, one path relative to the repo root per line.
+// No directory walk, the depth is the number of path components
+fn manifest_files(repo_path: &str, manifest: &str) -> Vec<(PathBuf, usize)> {
+    let content = fs::read_to_string(manifest).unwrap_or_default();
+    relative_files(content.lines().map(str::trim).filter(|l| !l.is_empty()))
+        .into_iter()
+        .map(|(path, depth)| (Path::new(repo_path).join(path), depth))
+        .collect()
+}
+
+fn relative_files<'a>(paths: impl Iterator<Item = &'a str>) -> Vec<(PathBuf, usize)> {
+    paths
+        .map(|p| (PathBuf::from(p), Path::new(p).components().count()))
+        .collect()
+}
+
+// .rs files at HEAD of a git repo, read from its trees rather than a checkout
+fn git_tree_files(repo_path: &str) -> Vec<(PathBuf, usize)> {
+    let output = Command::new("git")
+        .args(["-C", repo_path, "ls-tree", "-r", "-z", "--name-only", "HEAD"])
+        .stderr(Stdio::null())
+        .output();
+    let listing = match output {
+        Ok(o) => String::from_utf8_lossy(&o.stdout).into_owned(),
+        Err(_) => return vec![],
+    };
+    relative_files(listing.split('\0').filter(|p| p.ends_with(".rs")))
+}
+
+// Same as analyze_files, but the contents come out of the repo's object store
+// through one `git cat-file --batch`, so no working tree is ever written.
+// Paths are relative to the repo root, blobs that are missing count as nothing
+fn analyze_git_blobs(repo_path: &str, files: &[(PathBuf, usize)], threads: usize, per_file: bool) -> (FileStats, Vec<FileStats>) {
+    let mut totals = FileStats::default();
+    let mut indexed: Vec<(usize, FileStats)> = vec![];
+
+    let mut child = match Command::new("git")
+        .args(["-C", repo_path, "cat-file", "--batch"])
+        .stdin(Stdio::piped())
+        .stdout(Stdio::piped())
+        .stderr(Stdio::null())
+        .spawn()
     {
-        let content = fs::read_to_string(entry.path()).unwrap_or_default();
-        let lines = content.lines().count();
-        total_lines += lines;
-        max_depth = max_depth.max(entry.depth());
-
-        let parsed = match syn::parse_file(&content) {
-            Ok(p) => p,
-            Err(_) => continue,
-        };
+        Ok(c) => c,
+        Err(_) => return (totals, vec![FileStats::default(); if per_file { files.len() } else { 0 }]),
+    };
+
+    // Requests go in on their own thread so a full output pipe cannot deadlock us
+    let mut stdin = child.stdin.take().unwrap();
+    let requests: Vec<String> = files
+        .iter()
+        .map(|(path, _)| format!("HEAD:{}\n", path.to_string_lossy()))
+        .collect();
+    let writer = thread::spawn(move || {
+        for request in requests {
+            if stdin.write_all(request.as_bytes()).is_err() {
+                break;
+            }
+        }
+    });
+
+    let mut reader = BufReader::new(child.stdout.take().unwrap());
+    let (sender, receiver) = sync_channel::<(usize, String)>(threads.max(1) * 2);
+    let receiver = Mutex::new(receiver);
 
-        let mut file_has_ffi = false;
+    thread::scope(|scope| {
+        let handles: Vec<_> = (0..threads.max(1))
+            .map(|_| {
+                thread::Builder::new()
+                    .stack_size(8 * 1024 * 1024)
+                    .spawn_scoped(scope, || {
+                        let mut partial = FileStats::default();
+                        let mut each = vec![];
+                        loop {
+                            let next = receiver.lock().unwrap().recv();
+                            let (i, content) = match next {
+                                Ok(n) => n,
+                                Err(_) => break,
+                            };
+                            let stats = analyze_source(&content, files[i].1);
+                            partial.merge(&stats);
+                            if per_file {
+                                each.push((i, stats));
+                            }
+                        }
+                        (partial, each)
+                    })
+                    .unwrap()
+            })
+            .collect();
 
-        for item in &parsed.items {
-            if let Item::ForeignMod(fm) = &item {
-                if fm.abi.name.as_ref().map(|n| n.value() == "C").unwrap_or(false) {
-                    extern_c += 1;
-                    file_has_ffi = true;
-                }
+        // Each answer is "<sha> blob <size>\n<content>\n" or "<name> missing\n"
+        for i in 0..files.len() {
+            let mut header = String::new();
+            match reader.read_line(&mut header) {
+                Ok(0) | Err(_) => break,
+                Ok(_) => {}
+            }
+            let header = header.trim_end();
+            if header.ends_with(" missing") || header.ends_with(" ambiguous") {
+                continue;
+            }
+            let fields: Vec<&str> = header.rsplitn(3, ' ').collect();
+            let size: usize = match fields.first().and_then(|n| n.parse().ok()) {
+                Some(n) => n,
+                None => break,
+            };
+            let mut content = vec![0; size + 1];
+            if reader.read_exact(&mut content).is_err() {
+                break;
             }
-            if let Item::Fn(f) = &item {
-                if f.sig.unsafety.is_some() {
-                    unsafe_fn_count += 1;
-                    file_has_ffi = true;
-                }
+            content.truncate(size);
+            if fields.get(1) != Some(&"blob") {
+                continue;
             }
-            for attr in get_attrs(item) {
-                if attr.path().is_ident("link") {
-                    link_attr += 1;
-                    file_has_ffi = true;
-                }
-                if attr.path().is_ident("no_mangle") {
-                    no_mangle += 1;
-                    file_has_ffi = true;
-                }
+            // Same as read_to_string failing on a working tree file
+            let text = String::from_utf8(content).unwrap_or_default();
+            if sender.send((i, text)).is_err() {
+                break;
             }
         }
+        drop(sender);
 
-        // Count unsafe blocks
-        unsafe_count += content.matches("unsafe {").count(); // Fast and simple heuristic
-        if content.contains("unsafe") {
-            file_has_ffi = true;
+        for handle in handles {
+            let (partial, each) = handle.join().unwrap();
+            totals.merge(&partial);
+            indexed.extend(each);
         }
+    });
 
-        if file_has_ffi {
-            ffi_file_count += 1;
+    drop(reader);
+    let _ = writer.join();
+    let _ = child.wait();
+
+    // Files git did not have still get an (empty) entry so records line up
+    let mut each = vec![];
+    if per_file {
+        each = vec![FileStats::default(); files.len()];
+        for (i, stats) in indexed {
+            each[i] = stats;
         }
     }
+    (totals, each)
+}
+
+// Walks the repo unless a manifest of its .rs files is given.
+// With from_git the files are read from HEAD's blobs instead of the working tree
+fn analyze_repo(repo_path: &str, manifest: Option<&str>, opts: &Options) -> RepoStats {
+    let (totals, each, files) = if opts.from_git {
+        let files = match manifest {
+            Some(m) => relative_files(fs::read_to_string(m).unwrap_or_default().lines().map(str::trim).filter(|l| !l.is_empty())),
+            None => git_tree_files(repo_path),
+        };
+        let (totals, each) = analyze_git_blobs(repo_path, &files, opts.threads, opts.per_file);
+        (totals, each, files)
+    } else {
+        let files = match manifest {
+            Some(m) => manifest_files(repo_path, m),
+            None => walk_files(repo_path),
+        };
+        let (totals, each) = analyze_files(&files, opts.threads, opts.per_file);
+        (totals, each, files)
+    };
+    let per_file = opts.per_file;
 
-    let classification = if extern_c > 0 || link_attr > 0 || no_mangle > 0 {
+    let file_records = if per_file {
+        Some(
+            files
+                .iter()
+                .zip(each)
+                .map(|((path, _), stats)| FileRecord {
+                    file: path
+                        .strip_prefix(repo_path)
+                        .unwrap_or(path)
+                        .to_string_lossy()
+                        .into_owned(),
+                    stats,
+                })
+                .collect(),
+        )
+    } else {
+        None
+    };
+
+    let classification = if totals.extern_c > 0 || totals.link_attr > 0 || totals.no_mangle > 0 {
         "FFI-related"
     } else {
         "Pure Rust"
     }.to_string();
 
     RepoStats {
-        total_lines,
-        extern_c,
-        link_attr,
-        no_mangle,
-        unsafe_count,
-        unsafe_fn_count,
-        ffi_file_count,
-        max_depth,
+        total_lines: totals.lines,
+        extern_c: totals.extern_c,
+        link_attr: totals.link_attr,
+        no_mangle: totals.no_mangle,
+        unsafe_count: totals.unsafe_count,
+        unsafe_fn_count: totals.unsafe_fn_count,
+        ffi_file_count: totals.ffi_file_count,
+        max_depth: totals.max_depth,
         classification,
+        files: file_records,
     }
 }
 
+// Prints one compact JSON record per repo, stdout flushes at each newline
+fn print_record(repo_path: &str, manifest: Option<&str>, opts: &Options) {
+    let record = BatchRecord {
+        path: repo_path,
+        stats: analyze_repo(repo_path, manifest, opts),
+    };
+    println!("{}", serde_json::to_string(&record).unwrap());
+}
+
+fn usage() -> ! {
+    eprintln!("Usage: rust_ffi_metrics [--threads N] [--files <manifest>] [--per-file] [--git] <path> | <path> <path>... | --stdin");
+    std::process::exit(1);
+}
+
 fn main() {
-    let args: Vec<String> = env::args().collect();
+    // --threads N parses files in parallel, defaults to every core
+    let mut threads = thread::available_parallelism().map(|n| n.get()).unwrap_or(1);
+    // --files <manifest> lists the .rs files to read, so the checkout is not walked
+    let mut manifest: Option<String> = None;
+    // --per-file adds a "files" list with each file's counts, for callers that cache them
+    let mut per_file = false;
+    // --git reads HEAD's blobs through git cat-file, no checkout needed
+    let mut from_git = false;
+    let mut args: Vec<String> = vec![];
+    let mut raw = env::args();
+    while let Some(arg) = raw.next() {
+        if arg == "--threads" {
+            threads = match raw.next().and_then(|n| n.parse().ok()) {
+                Some(n) => n,
+                None => usage(),
+            };
+        } else if arg == "--git" {
+            from_git = true;
+        } else if arg == "--per-file" {
+            per_file = true;
+        } else if arg == "--files" {
+            manifest = match raw.next() {
+                Some(m) => Some(m),
+                None => usage(),
+            };
+        } else {
+            args.push(arg);
+        }
+    }
     if args.len() < 2 {
-        eprintln!("Usage: rust_ffi_metrics <path>");
-        std::process::exit(1);
+        usage();
+    }
+    let opts = Options {
+        threads,
+        per_file,
+        from_git,
+    };
+
+    // Long-lived worker: repo paths arrive one per line, a record goes out per path.
+    // A line can also be "<path>\t<manifest>"
+    if args[1] == "--stdin" {
+        for line in io::stdin().lock().lines() {
+            let line = match line {
+                Ok(l) => l,
+                Err(_) => break,
+            };
+            let mut fields = line.trim().splitn(2, '\t');
+            let repo_path = fields.next().unwrap_or("");
+            if !repo_path.is_empty() {
+                print_record(repo_path, fields.next(), &opts);
+            }
+        }
+        return;
+    }
+
+    // Several paths: JSON Lines, one record each
+    if args.len() > 2 {
+        for repo_path in &args[1..] {
+            print_record(repo_path, None, &opts);
+        }
+        return;
     }
 
     let repo_path = &args[1];
-    let stats = analyze_repo(repo_path);
+    let stats = analyze_repo(repo_path, manifest.as_deref(), &opts);
 
     let json = serde_json::to_string_pretty(&stats).unwrap();
     println!("{}", json);
@@ -1,7 +1,9 @@
-import json
 import yaml
 import sys
 
+import _root
+from record_io import RecordWriter, iter_records
+
 def main():
     yaml_file = sys.argv[1]
     json_file = sys.argv[2]
@@ -11,20 +13,18 @@ def main():
         yaml_data = yaml.safe_load(yf)
         yaml_names = set(entry["name"] for entry in yaml_data)
 
-    with open(json_file, "r") as jf:
-        json_data = json.load(jf)
-
-    filtered = {
-        name: info
-        for name, info in json_data.items()
-        if name in yaml_names
-    }
-
-    with open(output_file, "w") as out:
-        json.dump(filtered, out, indent=2)
+    # json entries are streamed through, .jsonl in and out keeps one in memory
+    kept = 0
+    seen = 0
+    with RecordWriter(output_file, indent=2) as out:
+        for name, info in iter_records(json_file):
+            seen += 1
+            if name in yaml_names:
+                kept += 1
+                out.write(name, info)
 
-    print(f"✅ Filtered {len(filtered)} entries into {output_file}")
-    print(f" out of {len(json_data.items())} rs files in json")
+    print(f"✅ Filtered {kept} entries into {output_file}")
+    print(f" out of {seen} rs files in json")
     print(f" and    {len(yaml_names)}        rs files in .yaml")
     
 main()
@@ -0,0 +1,179 @@
+import fnmatch
+import os
+import re
+import subprocess
+import sys
+import time
+
+from pipeline_metrics import metrics
+
+
+# streams the file listing of a gitiles HEAD archive
+# yields one member path at a time so memory does not grow with the archive
+# raises CalledProcessError once the listing ends if the download or tar failed
+# curl reports its download time and size on stderr for the run metrics, the
+# "tar listing" stage is the whole stream, which overlaps the download
+def stream_archive_listing(repo_url, limiter=None):
+    archive_url = repo_url + '/+archive/HEAD.tar.gz'
+    cmd = ['curl', '-sS', '-L', '-w', '%{stderr}\n%{time_total} %{size_download}', archive_url]
+    tar_cmd = ['tar', '-tzf', '-']  # List all files
+
+    if limiter:
+        limiter.wait(archive_url)
+    started = time.perf_counter()
+    curl = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    tar = subprocess.Popen(tar_cmd, stdin=curl.stdout, stdout=subprocess.PIPE, text=True)
+    # let curl see a broken pipe if tar exits early
+    curl.stdout.close()
+
+    try:
+        for line in tar.stdout:
+            path = line.rstrip("\n")
+            if path:
+                yield path
+    finally:
+        tar.stdout.close()
+        tar.wait()
+        curl.wait()
+        record_download(curl.stderr.read(), started)
+        curl.stderr.close()
+        metrics.observe("tar listing", time.perf_counter() - started, started=started)
+
+    if tar.returncode != 0:
+        raise subprocess.CalledProcessError(tar.returncode, tar_cmd)
+
+
+# takes curl's "time size" line off the end of its stderr, anything before it
+# is an error message and is passed on
+def record_download(stderr, started=None):
+    message, _, stats = stderr.rpartition("\n")
+    if message.strip():
+        print(message.strip(), file=sys.stderr)
+    try:
+        seconds, size = stats.split()
+        metrics.observe("archive download", float(seconds), started=started)
+        metrics.count("archive bytes", int(size))
+    except ValueError:
+        pass
+
+
+# listing of the HEAD archive at commit
+# served from the cache when it holds this commit, otherwise downloaded
+# and stored in the cache on the way through
+# lister, e.g. a TreeCrawler, is asked first for the same listing without the
+# archive (gitiles ?format=JSON&recursive=1); the archive is the fallback
+def archive_listing(repo_url, commit=None, cache=None, limiter=None, lister=None):
+    if cache is None or commit is None:
+        return fetch_listing(repo_url, commit, limiter, lister)
+
+    paths = cache.get_listing(repo_url, commit)
+    if paths is None:
+        paths = cache.record_listing(repo_url, commit, fetch_listing(repo_url, commit, limiter, lister))
+    else:
+        metrics.count("listing cache hits")
+    return paths
+
+
+def fetch_listing(repo_url, commit=None, limiter=None, lister=None):
+    paths = None
+    if lister:
+        with metrics.stage("gitiles listing"):
+            paths = lister.tree_listing(repo_url, commit, limiter)
+    if paths is None:
+        # a generator, nothing is downloaded until it is read
+        paths = stream_archive_listing(repo_url, limiter)
+    return paths
+
+
+# commit the HEAD archive is built from, AOSP heads point at main, older repos at master
+def head_commit(git_branches):
+    for branch in ("main", "master"):
+        if branch in git_branches:
+            return git_branches[branch]
+    return None
+
+
+# normalizes what callers pass as extensions to {label: [glob, ...]}
+# accepts ".rs", a list like [".rs", ".c"] or a mapping like
+# {"c++": ["*.cc", "*.cpp"], ".rs": "*.rs"}
+def extension_patterns(extensions):
+    if isinstance(extensions, str):
+        extensions = [extensions]
+    if not isinstance(extensions, dict):
+        extensions = {extension: "*" + extension for extension in extensions}
+    return {label: [globs] if isinstance(globs, str) else list(globs)
+            for label, globs in extensions.items()}
+
+
+# builds one matcher for all extension patterns, returns path -> label or None
+# plain "*.ext" globs become a dict lookup on the text after the last dot,
+# anything else is folded into a single regex alternation.
+# a path counts for the first label that matches it, in declaration order,
+# the regex is only tried when one of its labels comes before the suffix match
+def compile_matcher(extensions):
+    suffixes = {}  # last extension -> [(full suffix, label index, label)]
+    globs = []
+    for index, (label, patterns) in enumerate(extension_patterns(extensions).items()):
+        for pattern in patterns:
+            suffix = pattern[1:]
+            if pattern.startswith("*") and suffix.startswith(".") and not any(c in suffix for c in "*?["):
+                suffixes.setdefault(suffix[suffix.rfind("."):], []).append((suffix, index, label))
+            else:
+                globs.append((pattern, index, label))
+
+    regex = re.compile("|".join(f"({fnmatch.translate(pattern)})" for pattern, _, _ in globs)) if globs else None
+    first_glob = globs[0][1] if globs else None
+
+    def match(path):
+        best = None
+        dot = path.rfind(".")
+        if dot >= 0:
+            for suffix, index, label in suffixes.get(path[dot:], ()):
+                if path.endswith(suffix):
+                    best = (index, label)
+                    break
+        if regex and (best is None or first_glob < best[0]):
+            # the alternation matches the earliest declared glob that fits
+            found = regex.match(path)
+            if found:
+                _, index, label = globs[found.lastindex - 1]
+                if best is None or index < best[0]:
+                    best = (index, label)
+        return best[1] if best else None
+
+    return match
+
+
+# one pass over an archive listing shared by pyscraper.py and rs_path_collector.py
+# counts all entries and each extension label, and writes paths ending in
+# path_extension to path_file as they stream by. they go to path_file.tmp first,
+# which replaces path_file only once the whole listing is through, so a failed
+# download leaves the previous file as it was.
+# returns total, {label: count} and path_file, or None if no path matched
+def scan_listing(paths, extensions, path_file=None, path_extension=".rs"):
+    total_files = 0
+    counts = dict.fromkeys(extension_patterns(extensions), 0)
+    match = compile_matcher(extensions)
+    temp_file = path_file + ".tmp" if path_file else None
+    out = None
+    try:
+        for path in paths:
+            total_files += 1
+            label = match(path)
+            if label is not None:
+                counts[label] += 1
+            if path_file and path.endswith(path_extension):
+                # only create the file once there is something to put in it
+                if out is None:
+                    out = open(temp_file, "w")
+                out.write(path + "\n")
+    except BaseException:
+        if out:
+            out.close()
+            os.remove(temp_file)
+        raise
+
+    if out:
+        out.close()
+        os.replace(temp_file, path_file)
+    return total_files, counts, path_file if out else None
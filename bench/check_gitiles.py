@@ -0,0 +1,99 @@
+import argparse
+import os
+import sys
+import tempfile
+
+import corpus
+from corpus import ensure_corpus
+from server import start_server
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+from archive_scan import scan_listing, stream_archive_listing
+from scrape_cache import ScrapeCache
+from tree_crawler import TreeCrawler
+
+# checks tree_crawler.py against the gitiles stand-in in server.py, on a small corpus:
+# - tree_listing (one ?format=JSON&recursive=1 request) gives the same totals as the +archive tarball
+# - main_branch_url is the tree url, from the JSON branch list and from the html RefList
+# - count_files takes one request per repository on a JSON host and never marks it html-only
+# - the html crawl of a host without JSON counts the same, quick_count stops at the first match
+# - a second html crawl through the same ScrapeCache is answered by 304s only, past its JSON probes
+# prints one line per check and exits with 1 if any failed
+
+SMALL_CORPUS = {"small": 30, "large": 1, "large_files": 2000}
+
+
+def main():
+    args = parse_args()
+    manifest = ensure_corpus(args.corpus, corpus.params_from_args(args))
+    json_server, json_url = start_server(args.corpus)
+    html_server, html_url = start_server(args.corpus, gitiles_json=False)
+    names = [repo["name"] for repo in manifest["repos"]]
+    failures = []
+
+    def check(description, passed):
+        print(f"[{'ok' if passed else 'FAIL'}] {description}")
+        if not passed:
+            failures.append(description)
+
+    try:
+        expected = {}
+        crawler = TreeCrawler()
+        for name in names:
+            archive_total, archive_counts, _ = scan_listing(stream_archive_listing(f"{json_url}/{name}"), [".rs"])
+            expected[name] = archive_counts[".rs"]
+            tree_total, tree_counts, _ = scan_listing(crawler.tree_listing(f"{json_url}/{name}") or [], [".rs"])
+            check(f"{name}: tree_listing {tree_total} entries / {tree_counts['.rs']} .rs, "
+                  f"archive {archive_total} / {archive_counts['.rs']}",
+                  (tree_total, tree_counts) == (archive_total, archive_counts))
+
+        for label, base_url in (("json", json_url), ("html", html_url)):
+            url = TreeCrawler().main_branch_url(f"{base_url}/{names[0]}")
+            check(f"main_branch_url from {label}: {url}", url == f"{base_url}/{names[0]}/+/refs/heads/main/")
+
+        crawler = TreeCrawler()
+        before = json_server.stats["gitiles"]
+        counts = {name: crawler.count_files([f"{json_url}/{name}/+/refs/heads/main"], ".rs") for name in names}
+        requests = json_server.stats["gitiles"] - before
+        check(f"json count_files matches the archive in {requests} requests for {len(names)} repositories",
+              counts == expected and requests == len(names) and not crawler.html_only_hosts)
+
+        crawler = TreeCrawler()
+        counts = {name: crawler.count_files([crawler.main_branch_url(f"{html_url}/{name}")], ".rs") for name in names}
+        check("html count_files matches the archive", counts == expected)
+        quick = {name: crawler.count_files([f"{html_url}/{name}/+/refs/heads/main/"], ".rs", quick_count=True)
+                 for name in names}
+        check("quick_count is 1 exactly where there are .rs files",
+              quick == {name: int(count > 0) for name, count in expected.items()})
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = ScrapeCache(os.path.join(temp_dir, "cache.sqlite"))
+            TreeCrawler(cache=cache).count_files([f"{html_url}/{names[-1]}/+/refs/heads/main/"], ".rs")
+            before = dict(html_server.stats)
+            count = TreeCrawler(cache=cache).count_files([f"{html_url}/{names[-1]}/+/refs/heads/main/"], ".rs")
+            pages = html_server.stats["gitiles"] - before["gitiles"]
+            # the ?format=JSON probes a fresh crawler makes before falling back to html are never cached
+            pages -= html_server.stats["json refused"] - before.get("json refused", 0)
+            not_modified = html_server.stats["not modified"] - before.get("not modified", 0)
+            check(f"cached html crawl: {not_modified} of {pages} pages answered with 304",
+                  count == expected[names[-1]] and pages > 0 and not_modified == pages)
+            cache.close()
+    finally:
+        json_server.shutdown()
+        html_server.shutdown()
+
+    print(f"{len(failures)} failed" if failures else "all checks passed")
+    sys.exit(1 if failures else 0)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="check tree_crawler.py against the local gitiles stand-in")
+    parser.add_argument("--corpus", default=os.path.join(BENCH_DIR, "corpus_check"),
+                        help="where the generated repositories are kept, reused while the parameters match")
+    corpus.add_arguments(parser, SMALL_CORPUS)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import json
+import os
+import random
+import shutil
+import subprocess
+
+# synthetic AOSP-like corpus for the benchmarks: many small repositories, a
+# handful of rust crates, and a few huge ones like prebuilts or cronet with
+# tens of thousands of files and only a sprinkling of .rs among them.
+# every repository is a bare git repo with one commit on main, written with
+# git fast-import, plus the HEAD tarball gitiles would serve for +archive.
+# the same parameters and seed always give the same corpus
+
+DIR_NAMES = ["src", "lib", "libs", "drivers", "kernel", "hal", "core", "include", "tests", "common",
+             "platform", "sandbox", "utils", "ffi", "bindings", "sys", "net", "crypto", "media", "arm64"]
+OTHER_EXTENSIONS = [".c", ".h", ".cc", ".java", ".kt", ".py", ".bp", ".mk", ".xml", ".txt", ".go"]
+
+DEFAULTS = {
+    "small": 200,             # repositories of a few dozen files
+    "small_files": 40,        # mean file count of a small repository
+    "rust_share": 0.25,       # fraction of small repositories that are rust crates
+    "rust_density": 0.7,      # fraction of .rs files in a rust crate
+    "large": 2,               # prebuilts-sized repositories
+    "large_files": 20000,
+    "large_rust_density": 0.02,
+    "max_depth": 6,
+    "seed": 1,
+}
+
+COMMIT_TIME = "1700000000 +0000"
+
+
+# --small, --large-files, ... for every corpus parameter, defaults overrides some of DEFAULTS
+def add_arguments(parser, defaults=None):
+    for key, value in dict(DEFAULTS, **(defaults or {})).items():
+        parser.add_argument("--" + key.replace("_", "-"), type=type(DEFAULTS[key]), default=value,
+                            help=f"corpus parameter (default {value})")
+
+
+# the corpus parameters out of parsed arguments
+def params_from_args(args):
+    return {key: getattr(args, key) for key in DEFAULTS}
+
+
+# one valid rust file with a mix of the constructs rust_ffi_metrics counts
+def rust_source(rng, index):
+    lines = [f"// generated file {index}"]
+    if rng.random() < 0.3:
+        lines.append("use std::ffi::CStr;")
+    if rng.random() < 0.2:
+        lines += ['#[link(name = "c")]', 'extern "C" {', "    fn abs(x: i32) -> i32;", "}"]
+    if rng.random() < 0.15:
+        lines += ["#[no_mangle]", f'pub extern "C" fn exported_{index}(x: i32) -> i32 {{', "    x + 1", "}"]
+    depth = rng.randint(1, 6)
+    body = ["let mut total = 0;"]
+    for level in range(depth):
+        body = [f"if x > {level} {{"] + ["    " + line for line in body] + ["}"]
+    if rng.random() < 0.25:
+        body = ["unsafe {"] + ["    " + line for line in body] + ["}"]
+    lines.append(f"pub fn compute_{index}(x: i32) -> i32 {{")
+    lines += ["    " + line for line in body + ["total"]]
+    lines.append("}")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def other_source(rng, index, extension):
+    return (f"// {extension} file {index}\n" + "x" * rng.randint(20, 400) + "\n").encode()
+
+
+# {path: contents} for one repository of about file_count files
+def repo_files(rng, file_count, rust_density, max_depth):
+    files = {}
+    for index in range(file_count):
+        depth = rng.randint(0, max_depth)
+        directory = "/".join(rng.choice(DIR_NAMES) for _ in range(depth))
+        if rng.random() < rust_density:
+            name = f"file_{index}.rs"
+            contents = rust_source(rng, index)
+        else:
+            extension = rng.choice(OTHER_EXTENSIONS)
+            name = f"file_{index}{extension}"
+            contents = other_source(rng, index, extension)
+        files[f"{directory}/{name}" if directory else name] = contents
+    if rust_density > 0:
+        files["Cargo.toml"] = b'[package]\nname = "generated"\nversion = "0.1.0"\n'
+    return files
+
+
+# [(name, file_count, rust_density)] of every repository in the corpus
+def corpus_plan(params):
+    rng = random.Random(params["seed"])
+    plan = []
+    for index in range(params["small"]):
+        count = max(1, int(rng.expovariate(1 / params["small_files"])))
+        if rng.random() < params["rust_share"]:
+            plan.append((f"platform/external/rust/crates/crate_{index:04d}", count, params["rust_density"]))
+        else:
+            plan.append((f"platform/packages/apps/app_{index:04d}", count, 0.0))
+    for index in range(params["large"]):
+        plan.append((f"platform/prebuilts/huge_{index}", params["large_files"], params["large_rust_density"]))
+    return plan
+
+
+# a bare repository at git_dir with files as the single commit on main
+def write_repo(git_dir, files):
+    subprocess.run(["git", "init", "--quiet", "--bare", git_dir], check=True)
+    for key, value in (("uploadpack.allowFilter", "true"), ("uploadpack.allowAnySHA1InWant", "true"),
+                       ("http.receivepack", "false")):
+        subprocess.run(["git", "-C", git_dir, "config", key, value], check=True)
+    subprocess.run(["git", "-C", git_dir, "symbolic-ref", "HEAD", "refs/heads/main"], check=True)
+
+    chunks = [b"commit refs/heads/main\n",
+              f"committer Bench <bench@example.com> {COMMIT_TIME}\n".encode(),
+              b"data 8\ngenerate\n"]
+    for path, contents in sorted(files.items()):
+        chunks.append(f"M 100644 inline {path}\ndata {len(contents)}\n".encode())
+        chunks.append(contents + b"\n")
+    subprocess.run(["git", "-C", git_dir, "fast-import", "--quiet"], input=b"".join(chunks), check=True)
+
+
+# makes the corpus under root unless one with the same parameters is there
+# returns the corpus description: parameters and each repository's name and file count
+def ensure_corpus(root, params=None):
+    params = dict(DEFAULTS, **(params or {}))
+    manifest_file = os.path.join(root, "corpus.json")
+    if os.path.exists(manifest_file):
+        with open(manifest_file, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest["params"] == params:
+            return manifest
+
+    print(f"[+] Generating corpus in {root}")
+    for folder in ("git", "archives"):
+        shutil.rmtree(os.path.join(root, folder), ignore_errors=True)
+    repos = []
+    for index, (name, file_count, rust_density) in enumerate(corpus_plan(params)):
+        # each repository gets its own generator so one size change does not reshuffle the rest
+        rng = random.Random(f"{params['seed']}:{name}")
+        files = repo_files(rng, file_count, rust_density, params["max_depth"])
+        git_dir = os.path.join(root, "git", name + ".git")
+        write_repo(git_dir, files)
+        archive = os.path.join(root, "archives", name + ".tar.gz")
+        os.makedirs(os.path.dirname(archive), exist_ok=True)
+        subprocess.run(["git", "-C", git_dir, "archive", "--format=tar.gz", "-o", os.path.abspath(archive), "HEAD"],
+                       check=True)
+        repos.append({"name": name, "files": len(files), "rs_files": sum(1 for path in files if path.endswith(".rs"))})
+
+    manifest = {"params": params, "repos": repos}
+    with open(manifest_file, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import corpus
+from corpus import ensure_corpus
+from server import start_server
+
+# end-to-end benchmark of the pipeline against a local synthetic corpus:
+# pyscraper.py (count_files_in_all_repositories_git), rs_path_collector.py,
+# analyzer.py (analyze_json_repos) and results.py run one after another on the
+# corpus served by server.py, nothing touches android.googlesource.com.
+# each stage runs as its own process, so its wall time, CPU time and peak RSS
+# (including the git, curl and rust_ffi_metrics processes under it) are its own.
+# every run is appended to a JSON Lines file with the commit it ran on, and the
+# table at the end compares against the last run of another commit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+ANALYZER_DIR = os.path.join(ROOT_DIR, "analyzer")
+STAGES = ["scrape", "collect", "analyze", "results"]
+
+
+def main():
+    args = parse_args()
+    manifest = ensure_corpus(args.corpus, corpus.params_from_args(args))
+    server, base_url = start_server(args.corpus)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="pyscraper_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    print(f"[+] {len(manifest['repos'])} repositories at {base_url}, working in {workdir}")
+
+    rust_binary = args.rust_binary or find_rust_binary()
+    stages = {}
+    try:
+        write_input(os.path.join(workdir, "repos.json"), manifest, base_url)
+        for stage in args.stages.split(","):
+            if stage == "analyze" and not rust_binary:
+                print("[!] No rust_ffi_metrics binary, build it or pass --rust-binary. analyze and results skipped")
+                break
+            stages[stage] = run_stage(stage, workdir, args, rust_binary)
+            if stages[stage]["returncode"] != 0:
+                print(f"[!] {stage} failed, see {stages[stage]['log']}")
+                break
+    finally:
+        server.shutdown()
+        if not args.workdir and not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    record = {
+        "commit": git_commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "label": args.label,
+        "corpus": manifest["params"],
+        "settings": {"workers": args.workers, "scrape_args": args.scrape_args,
+                     "collect_args": args.collect_args, "analyze_args": args.analyze_args},
+        "stages": stages,
+    }
+    baseline = find_baseline(args.results, record)
+    with open(args.results, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+    print_table(record, baseline)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="time the scraper and analyzer on a local synthetic corpus")
+    parser.add_argument("--corpus", default=os.path.join(BENCH_DIR, "corpus"),
+                        help="where the generated repositories are kept, reused while the parameters match")
+    corpus.add_arguments(parser)
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help="comma separated stages to run, in order: " + ",".join(STAGES))
+    parser.add_argument("--workers", type=int, default=8,
+                        help="pyscraper --workers and analyzer --clone-workers")
+    parser.add_argument("--scrape-args", default="", help="extra pyscraper.py options, e.g. \"--refs http\"")
+    parser.add_argument("--collect-args", default="", help="extra rs_path_collector.py options")
+    parser.add_argument("--analyze-args", default="", help="extra analyzer.py options, e.g. \"--batch --manifest\"")
+    parser.add_argument("--rust-binary", default=None,
+                        help="rust_ffi_metrics to analyze with (default: the one under analyzer/rust_ffi_metrics)")
+    parser.add_argument("--workdir", default=None, help="keep the run's files here instead of a temporary folder")
+    parser.add_argument("--keep-workdir", action="store_true", help="do not delete the temporary folder")
+    parser.add_argument("--results", default=os.path.join(BENCH_DIR, "results.jsonl"),
+                        help="JSON Lines file every run is appended to")
+    parser.add_argument("--label", default=None, help="free text stored with the run")
+    return parser.parse_args()
+
+
+# the pipeline's input: every corpus repository with its local clone_url
+def write_input(filename, manifest, base_url):
+    repos = {repo["name"]: {"name": repo["name"], "clone_url": f"{base_url}/{repo['name']}"}
+             for repo in manifest["repos"]}
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(repos, f, indent=4)
+
+
+def find_rust_binary():
+    release = os.path.join(ANALYZER_DIR, "rust_ffi_metrics", "target", "release")
+    for name in ("rust_ffi_metrics", "rust_ffi_metrics.exe"):
+        path = os.path.join(release, name)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+
+# command line of a stage and how to count what it got through
+# returns (command, environment, items function, unit)
+def stage_command(stage, workdir, args, rust_binary):
+    metrics_file = os.path.join(workdir, f"{stage}_metrics.json")
+    python = sys.executable
+    if stage == "scrape":
+        command = [python, os.path.join(ROOT_DIR, "pyscraper.py"), "repos.json", "--workers", str(args.workers)]
+        command += shlex.split(args.scrape_args)
+        return command + ["--metrics", metrics_file], {}, lambda: sum_field(workdir, "repos_output.json", "total"), \
+            "files listed"
+    if stage == "collect":
+        command = [python, os.path.join(ANALYZER_DIR, "rs_path_collector.py"), "repos_output.json", "collected.json"]
+        command += shlex.split(args.collect_args)
+        return command + ["--metrics", metrics_file], {}, lambda: sum_field(workdir, "collected.json", ".rs"), \
+            "rs paths"
+    if stage == "analyze":
+        prepare_analyzer(workdir, rust_binary)
+        command = [python, os.path.join(ANALYZER_DIR, "analyzer.py"), "analyzer_input.json",
+                   "--clone-workers", str(args.workers)]
+        command += shlex.split(args.analyze_args)
+        return command + ["--metrics", metrics_file], {}, lambda: analyzed_rs_files(workdir), "rs files"
+    if stage == "results":
+        command = [python, os.path.join(ANALYZER_DIR, "results.py"), "ffi_metrics.json"]
+        return command, {"MPLBACKEND": "Agg"}, lambda: count_records(workdir, "ffi_metrics.json"), "repositories"
+    raise ValueError(f"unknown stage {stage}")
+
+
+# analyzer.py looks for its binary under the working directory and resolves
+# rs_path_file against its own folder, so the input gets absolute paths
+def prepare_analyzer(workdir, rust_binary):
+    binary_dir = os.path.join(workdir, "rust_ffi_metrics", "target", "release")
+    os.makedirs(binary_dir, exist_ok=True)
+    link = os.path.join(binary_dir, "rust_ffi_metrics.exe")
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.abspath(rust_binary), link)
+
+    repos = load_json(workdir, "collected.json")
+    for info in repos.values():
+        if info.get("rs_path_file"):
+            info["rs_path_file"] = os.path.join(workdir, info["rs_path_file"])
+    with open(os.path.join(workdir, "analyzer_input.json"), "w", encoding="utf-8") as f:
+        json.dump(repos, f, indent=4)
+
+
+# runs one stage and measures it
+def run_stage(stage, workdir, args, rust_binary):
+    command, env, items, unit = stage_command(stage, workdir, args, rust_binary)
+    log = os.path.join(workdir, f"{stage}.log")
+    print(f"[+] {stage}: {' '.join(command)}")
+    with open(log, "w", encoding="utf-8") as out:
+        started = time.perf_counter()
+        process = subprocess.Popen(command, cwd=workdir, env=dict(os.environ, **env), stdout=out, stderr=subprocess.STDOUT)
+        returncode, usage = wait_with_usage(process)
+        seconds = time.perf_counter() - started
+
+    result = {"seconds": seconds, "returncode": returncode, "log": log}
+    if usage:
+        # ru_maxrss of a waited-for child covers its own children too; Linux reports KiB
+        result["peak_rss_mb"] = usage.ru_maxrss / 1024
+        result["cpu_seconds"] = usage.ru_utime + usage.ru_stime
+    if returncode == 0:
+        result["items"] = items()
+        result["unit"] = unit
+        result["throughput"] = result["items"] / seconds if seconds else 0.0
+        result["breakdown"] = stage_breakdown(os.path.join(workdir, f"{stage}_metrics.json"))
+    return result
+
+
+# (exit code, resource usage) of process, usage is None where wait4 does not exist
+def wait_with_usage(process):
+    if not hasattr(os, "wait4"):
+        return process.wait(), None
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return process.returncode, usage
+
+
+# {pipeline stage: total seconds} from the stage's --metrics file
+def stage_breakdown(metrics_file):
+    if not os.path.exists(metrics_file):
+        return {}
+    with open(metrics_file, "r", encoding="utf-8") as f:
+        return {name: stats["total"] for name, stats in json.load(f)["stages"].items()}
+
+
+def load_json(workdir, filename):
+    with open(os.path.join(workdir, filename), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def sum_field(workdir, filename, field):
+    return sum(info.get(field, 0) for info in load_json(workdir, filename).values())
+
+
+def count_records(workdir, filename):
+    return len(load_json(workdir, filename))
+
+
+# .rs files of the repositories that made it into ffi_metrics.json
+def analyzed_rs_files(workdir):
+    repos = load_json(workdir, "analyzer_input.json")
+    return sum(repos[name].get(".rs", 0) for name in load_json(workdir, "ffi_metrics.json") if name in repos)
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "-C", ROOT_DIR, "rev-parse", "--short", "HEAD"],
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "-C", ROOT_DIR, "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    return commit + ("+dirty" if dirty else "")
+
+
+# the latest earlier run on the same corpus and settings, preferring another commit
+def find_baseline(results_file, record):
+    if not os.path.exists(results_file):
+        return None
+    same_setup = []
+    with open(results_file, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            run = json.loads(line)
+            if run["corpus"] == record["corpus"] and run["settings"] == record["settings"]:
+                same_setup.append(run)
+    other_commits = [run for run in same_setup if run["commit"] != record["commit"]]
+    return (other_commits or same_setup or [None])[-1]
+
+
+def print_table(record, baseline=None):
+    print(f"\n=== Benchmark on {record['commit']} ===")
+    header = f"{'stage':<10}{'seconds':>10}{'cpu s':>9}{'peak MB':>10}{'throughput':>26}"
+    if baseline:
+        header += f"{'vs ' + str(baseline['commit']):>20}"
+    print(header)
+    for stage, result in record["stages"].items():
+        line = f"{stage:<10}{result['seconds']:>10.2f}{result.get('cpu_seconds', 0):>9.2f}" \
+               f"{result.get('peak_rss_mb', 0):>10.1f}"
+        line += f"{result['throughput']:>12.1f} {result['unit'] + '/s':<13}" if "throughput" in result \
+            else f"{'failed':>26}"
+        before = baseline["stages"].get(stage) if baseline else None
+        if before and before.get("seconds"):
+            line += f"{result['seconds'] / before['seconds']:>19.2f}x"
+        print(line)
+        for name, seconds in sorted(result.get("breakdown", {}).items(), key=lambda item: item[1], reverse=True):
+            print(f"    {name:<20}{seconds:>8.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import hashlib
+import html
+import json
+import os
+import subprocess
+import sys
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlparse
+
+# serves a corpus from corpus.py the way android.googlesource.com does for the
+# scripts: git smart-HTTP (ls-remote, clone, partial clone, blob fetch) through
+# git http-backend, <repo>/+archive/HEAD.tar.gz from the pre-built tarballs,
+# and the gitiles pages tree_crawler.py reads:
+#   <repo>/                         repository page with the branch RefList
+#   <repo>/+refs/heads?format=JSON  branch list
+#   <repo>/+/<ref>/<path>/          tree, as a FileList page or ?format=JSON[&recursive=1]
+#   <repo>/+/<ref>                  the commit, no tree entries (as on gitiles)
+# gitiles pages carry an ETag and answer If-None-Match with a 304. with
+# gitiles_json off, ?format=JSON requests fail like on a host without them.
+# repositories are addressed without .git, like gitiles clone urls
+
+GIT_ROUTES = ("/info/refs", "/git-upload-pack")
+ARCHIVE_ROUTE = "/+archive/HEAD.tar.gz"
+JSON_PREFIX = b")]}'\n"
+ENTRY_CLASSES = {"tree": "FileList-item--gitTree", "blob": "FileList-item--regularFile",
+                 "commit": "FileList-item--gitCommit"}
+
+
+class CorpusHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    corpus_root = None
+    gitiles_json = True
+    # requests by kind ("gitiles", "not modified", "json refused", "archive", "git"), shared by all handlers of a server
+    stats = None
+    stats_lock = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.route()
+
+    def do_POST(self):
+        self.route()
+
+    def count(self, kind):
+        with self.stats_lock:
+            self.stats[kind] += 1
+
+    def route(self):
+        url = urlparse(self.path)
+        if url.path.endswith(ARCHIVE_ROUTE):
+            self.count("archive")
+            return self.send_archive(url.path[:-len(ARCHIVE_ROUTE)].strip("/"))
+        for route in GIT_ROUTES:
+            index = url.path.find(route)
+            if index > 0:
+                self.count("git")
+                return self.run_http_backend(url.path[:index].strip("/"), url.path[index:], url.query)
+        if self.command == "GET":
+            self.count("gitiles")
+            return self.gitiles(url)
+        self.send_bytes(404, b"not found")
+
+    def git_dir(self, name):
+        path = os.path.join(self.corpus_root, "git", name + ".git")
+        return path if name and os.path.isdir(path) else None
+
+    def git(self, name, *args):
+        result = subprocess.run(["git", "-C", self.git_dir(name)] + list(args), capture_output=True)
+        return result.stdout if result.returncode == 0 else None
+
+    def gitiles(self, url):
+        query = parse_qs(url.query)
+        as_json = query.get("format", [""])[0] == "JSON"
+        if as_json and not self.gitiles_json:
+            self.count("json refused")
+            return self.send_bytes(404, b"not found")
+        name, marker, rest = url.path.strip("/").partition("/+")
+        if not self.git_dir(name):
+            return self.send_bytes(404, b"not found")
+        if not marker:
+            return self.send_page(self.repo_page(name))
+        if rest == "refs/heads" and as_json:
+            return self.send_page(JSON_PREFIX + json.dumps(self.branches(name)).encode(), "application/json")
+        if not rest.startswith("/"):
+            return self.send_bytes(404, b"not found")
+
+        ref, path = split_ref(rest[1:])
+        commit = self.git(name, "rev-parse", "--verify", "--quiet", ref + "^{commit}")
+        if not commit:
+            return self.send_bytes(404, b"not found")
+        commit = commit.decode().strip()
+        if not path and not url.path.endswith("/"):
+            # without the trailing "/" gitiles shows the commit, not its tree
+            page = {"commit": commit, "message": "generate\n"}
+            if as_json:
+                return self.send_page(JSON_PREFIX + json.dumps(page).encode(), "application/json")
+            return self.send_page(html_page(f"<div class='u-monospace Metadata'>commit {commit}</div>"))
+
+        recursive = query.get("recursive", [""])[0] in ("1", "true")
+        entries = self.tree_entries(name, commit, path.strip("/"), recursive)
+        if entries is None:
+            return self.send_bytes(404, b"not found")
+        if as_json:
+            return self.send_page(JSON_PREFIX + json.dumps({"entries": entries}).encode(), "application/json")
+        base = url.path.rstrip("/")
+        items = "".join(
+            f"<li class='FileList-item {ENTRY_CLASSES[entry['type']]}'>"
+            f"<a class='FileList-itemLink' href='{html.escape(base + '/' + quote(entry['name']))}"
+            f"{'/' if entry['type'] == 'tree' else ''}'>{html.escape(entry['name'])}</a></li>"
+            for entry in entries)
+        self.send_page(html_page(f"<div class='TreeDetail'><ol class='FileList'>{items}</ol></div>"))
+
+    # {branch: {"value": commit}}, like gitiles' +refs/heads?format=JSON
+    def branches(self, name):
+        output = self.git(name, "for-each-ref", "--format=%(refname:strip=2) %(objectname)", "refs/heads/") or b""
+        return {branch: {"value": commit} for branch, commit in
+                (line.split(" ", 1) for line in output.decode().splitlines())}
+
+    def repo_page(self, name):
+        # like gitiles, the branch links have no trailing "/"
+        items = "".join(f"<li class='RefList-item'><a href='/{name}/+/refs/heads/{branch}'>{branch}</a></li>"
+                        for branch in self.branches(name))
+        return html_page(f"<div class='RepoShortlog'><div class='RefList'><h3>Branches</h3>"
+                         f"<ul class='RefList-items'>{items}</ul></div></div>")
+
+    # gitiles JSON tree entries of commit:path, None if it is not a tree
+    def tree_entries(self, name, commit, path, recursive):
+        output = self.git(name, "ls-tree", "-z", *(["-r"] if recursive else []), f"{commit}:{path}")
+        if output is None:
+            return None
+        entries = []
+        for line in output.decode("utf-8", "replace").split("\0"):
+            info, _, entry_name = line.partition("\t")
+            if not entry_name:
+                continue
+            mode, kind, sha = info.split()
+            entries.append({"mode": int(mode, 8), "type": kind, "id": sha, "name": entry_name})
+        return entries
+
+    # a 200 with an ETag of its contents, or a 304 when the client already has them
+    def send_page(self, data, content_type="text/html; charset=utf-8"):
+        if isinstance(data, str):
+            data = data.encode()
+        etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.count("not modified")
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_bytes(200, data, [("Content-Type", content_type), ("ETag", etag)])
+
+    def send_bytes(self, status, data, headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_archive(self, name):
+        archive = os.path.join(self.corpus_root, "archives", name + ".tar.gz")
+        if not os.path.isfile(archive):
+            return self.send_bytes(404, b"not found")
+        with open(archive, "rb") as f:
+            self.send_bytes(200, f.read(), [("Content-Type", "application/x-gzip")])
+
+    # request body, plain or chunked (git sends large fetch requests chunked)
+    def read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return b"".join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    # one CGI call of git http-backend, its headers and body passed through
+    def run_http_backend(self, name, route, query):
+        if not os.path.isdir(os.path.join(self.corpus_root, "git", name + ".git")):
+            return self.send_bytes(404, b"not found")
+        env = dict(os.environ,
+                   GIT_PROJECT_ROOT=os.path.join(self.corpus_root, "git"),
+                   GIT_HTTP_EXPORT_ALL="1",
+                   PATH_INFO=f"/{name}.git{route}",
+                   QUERY_STRING=query,
+                   REQUEST_METHOD=self.command,
+                   CONTENT_TYPE=self.headers.get("Content-Type", ""),
+                   REMOTE_ADDR=self.client_address[0])
+        for header, variable in (("Git-Protocol", "GIT_PROTOCOL"), ("Content-Encoding", "HTTP_CONTENT_ENCODING")):
+            if self.headers.get(header):
+                env[variable] = self.headers[header]
+        body = self.read_body() if self.command == "POST" else b""
+        result = subprocess.run(["git", "http-backend"], input=body, env=env, capture_output=True)
+
+        # CGI headers end at the first blank line, with or without \r
+        ends = [(index, len(separator)) for separator in (b"\r\n\r\n", b"\n\n")
+                for index in [result.stdout.find(separator)] if index >= 0]
+        index, length = min(ends, default=(len(result.stdout), 0))
+        head, data = result.stdout[:index], result.stdout[index + length:]
+        status = 200
+        headers = []
+        for line in head.decode("latin-1").splitlines():
+            name, _, value = line.partition(":")
+            if name.lower() == "status":
+                status = int(value.split()[0])
+            elif name:
+                headers.append((name, value.strip()))
+        self.send_bytes(status, data, headers)
+
+
+# (ref, path) of what follows /+/ in a gitiles url, refs/heads/<branch> or a single name
+def split_ref(rest):
+    parts = rest.split("/")
+    length = 3 if parts[:2] == ["refs", "heads"] else 1
+    return "/".join(parts[:length]), "/".join(parts[length:])
+
+
+def html_page(body):
+    return f"<html><body><div class='Site-content'><div class='Container'>{body}</div></div></body></html>"
+
+
+# starts a server for corpus_root on a free local port in a background thread
+# returns (server, base url); server.shutdown() stops it, server.stats counts requests
+def start_server(corpus_root, port=0, gitiles_json=True):
+    handler = type("Handler", (CorpusHandler,), {"corpus_root": os.path.abspath(corpus_root),
+                                                 "gitiles_json": gitiles_json,
+                                                 "stats": Counter(), "stats_lock": threading.Lock()})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.stats = handler.stats
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# python bench/server.py <corpus dir> [port], to point the scripts at a corpus by hand
+def main():
+    corpus_root = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+    server, base_url = start_server(corpus_root, int(sys.argv[2]) if len(sys.argv) > 2 else 8080)
+    print(f"serving {corpus_root} at {base_url}")
+    threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,13 @@
-import json
 import sys
+from record_io import iter_records
 
 if len(sys.argv) != 3:
     print("Usage: python find_missing_entries.py <base.json> <to_check.json>")
     sys.exit(1)
 
-with open(sys.argv[1]) as f1, open(sys.argv[2]) as f2:
-    base = json.load(f1)
-    to_check = json.load(f2)
-
-missing = [name for name in base if name not in to_check]
+# only the names are kept, either file can be .json or .jsonl
+to_check = set(name for name, _ in iter_records(sys.argv[2]))
+missing = [name for name, _ in iter_records(sys.argv[1]) if name not in to_check]
 
 print("Missing entries:")
 for name in missing:
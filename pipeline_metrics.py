@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# timing and transfer counters shared by pyscraper.py, rs_path_collector.py and
+# analyzer.py. code anywhere in the pipeline wraps its work in
+# metrics.stage("clone") or bumps metrics.count("archive bytes", n), the scripts
+# print metrics.summary() at the end of a run and can export everything as JSON
+# (--metrics) or as a Chrome trace (--trace, open in chrome://tracing or Perfetto).
+# a stage entered inside metrics.repo(name) on the same thread is charged to
+# that repository too, so the summary can say which repositories took longest
+# and where their time went
+
+# upper bounds in seconds of the histogram buckets, the last one takes the rest
+BUCKETS = [0.01, 0.1, 1, 10, 60, 600]
+
+
+class PipelineMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = time.perf_counter()
+        self.counters = defaultdict(int)
+        self.timings = defaultdict(list)
+        self.repo_seconds = defaultdict(float)
+        self.repo_stages = defaultdict(lambda: defaultdict(float))
+        # Chrome trace events, only collected once enable_trace() is called
+        self.events = None
+
+    def enable_trace(self):
+        with self.lock:
+            if self.events is None:
+                self.events = []
+
+    def current_repo(self):
+        return getattr(self.local, "repo", None)
+
+    # adds value to a counter, e.g. bytes downloaded or cache hits
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    # records one duration of stage name, charged to repo (default: the current one)
+    def observe(self, name, seconds, repo=None, started=None):
+        repo = repo or self.current_repo()
+        with self.lock:
+            self.timings[name].append(seconds)
+            if repo:
+                self.repo_stages[repo][name] += seconds
+            if self.events is not None and started is not None:
+                self.events.append(self.trace_event(name, "stage", started, seconds, repo))
+
+    # times the block as one run of stage name
+    @contextmanager
+    def stage(self, name, repo=None):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, repo, started)
+
+    # stages inside the block on this thread belong to repository name,
+    # the block's time is added to the repository's wall time
+    @contextmanager
+    def repo(self, name):
+        outer = self.current_repo()
+        self.local.repo = name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self.local.repo = outer
+            with self.lock:
+                self.repo_seconds[name] += seconds
+                if self.events is not None:
+                    self.events.append(self.trace_event(name, "repo", started, seconds, name))
+
+    # seconds spent inside repo(name) blocks so far
+    def repo_time(self, name):
+        with self.lock:
+            return self.repo_seconds.get(name, 0.0)
+
+    # fn(*args) inside repo(name), for handing work to a thread pool
+    def run_in_repo(self, name, fn, *args):
+        with self.repo(name):
+            return fn(*args)
+
+    def trace_event(self, name, category, started, seconds, repo):
+        return {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": round((started - self.started) * 1e6),
+            "dur": round(seconds * 1e6),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": {"repo": repo} if repo else {},
+        }
+
+    # count, total, mean, p50, p95, max and bucket counts of one stage's durations
+    def histogram(self, name):
+        with self.lock:
+            values = sorted(self.timings.get(name, []))
+        if not values:
+            return {"count": 0, "total": 0.0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0, "buckets": {}}
+        buckets = [0] * (len(BUCKETS) + 1)
+        for value in values:
+            buckets[next((i for i, bound in enumerate(BUCKETS) if value <= bound), len(BUCKETS))] += 1
+        labels = [f"<={bound}s" for bound in BUCKETS] + [f">{BUCKETS[-1]}s"]
+        total = sum(values)
+        return {
+            "count": len(values),
+            "total": total,
+            "mean": total / len(values),
+            "p50": values[(len(values) - 1) // 2],
+            "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+            "max": values[-1],
+            "buckets": dict(zip(labels, buckets)),
+        }
+
+    # [(repo, seconds, {stage: seconds})], longest first
+    def slowest_repos(self, top=10):
+        with self.lock:
+            repos = sorted(self.repo_seconds.items(), key=lambda item: item[1], reverse=True)[:top]
+            return [(name, seconds, dict(self.repo_stages.get(name, {}))) for name, seconds in repos]
+
+    # everything recorded so far as one JSON-ready dict
+    def snapshot(self):
+        with self.lock:
+            names = list(self.timings)
+            counters = dict(self.counters)
+            repos = {name: {"seconds": seconds, "stages": dict(self.repo_stages.get(name, {}))}
+                     for name, seconds in self.repo_seconds.items()}
+        return {
+            "wall_seconds": time.perf_counter() - self.started,
+            "counters": counters,
+            "stages": {name: self.histogram(name) for name in names},
+            "repos": repos,
+        }
+
+    # end-of-run report: stages by total time, counters, the slowest repositories
+    def summary(self, top=10):
+        snapshot = self.snapshot()
+        lines = [f"=== Run metrics ({snapshot['wall_seconds']:.1f}s wall time) ==="]
+        stages = sorted(snapshot["stages"].items(), key=lambda item: item[1]["total"], reverse=True)
+        if stages:
+            lines.append(f"{'stage':<20}{'count':>8}{'total s':>10}{'mean s':>9}{'p50 s':>9}{'p95 s':>9}{'max s':>9}")
+            for name, stats in stages:
+                lines.append(f"{name:<20}{stats['count']:>8}{stats['total']:>10.1f}{stats['mean']:>9.2f}"
+                             f"{stats['p50']:>9.2f}{stats['p95']:>9.2f}{stats['max']:>9.2f}")
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"{name}: {value:,}")
+        slowest = self.slowest_repos(top)
+        if slowest:
+            lines.append(f"slowest {len(slowest)} repositories:")
+            for name, seconds, stages in slowest:
+                parts = ", ".join(f"{stage} {took:.1f}s"
+                                  for stage, took in sorted(stages.items(), key=lambda item: item[1], reverse=True))
+                lines.append(f"  {name}: {seconds:.1f}s" + (f" ({parts})" if parts else ""))
+        return "\n".join(lines)
+
+    def write_json(self, filename):
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def write_trace(self, filename):
+        with self.lock:
+            events = list(self.events or [])
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    # prints the summary and writes whichever exports were asked for
+    def report(self, metrics_file=None, trace_file=None, top=10):
+        print(self.summary(top))
+        if metrics_file:
+            self.write_json(metrics_file)
+        if trace_file:
+            self.write_trace(trace_file)
+
+
+# one per process, every module records into it
+metrics = PipelineMetrics()
+
+
+# --metrics and --trace for a script's argparse parser
+def add_arguments(parser):
+    parser.add_argument("--metrics", default=None,
+                        help="write stage timings, counters and per-repository times to this JSON file")
+    parser.add_argument("--trace", default=None,
+                        help="write a Chrome trace (chrome://tracing, Perfetto) of every stage to this file")
@@ -1,70 +1,248 @@
-import requests
-import json
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
+from urllib.parse import urlparse
 import sys
 import os
 import subprocess
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from archive_scan import archive_listing, extension_patterns, head_commit, scan_listing
+from scrape_cache import ScrapeCache
+from ref_fetcher import RefFetcher
+from record_io import RecordWriter, load_records
+from tree_crawler import TreeCrawler
+import pipeline_metrics
+from pipeline_metrics import metrics
 
 
 def main():
-    # Path to your JSON file containing repository {names, info{}}
-    input_file, output_file = in_out_filenames('_output.json')
-
-    # Load the JSON file
-    with open(input_file, 'r') as f:
-        data = json.load(f)
-        f.close()
+    args = parse_args()
+    if args.trace:
+        metrics.enable_trace()
 
-    count_files_in_all_repositories_git(data, '.rs')
-    
-    update_json_file(data, output_file)
-
-    
+    # Path to your JSON file containing repository {names, info{}}
+    # .jsonl output gets one line per repository as soon as it is counted
+    input_file, output_file = in_out_filenames('_output.jsonl' if args.jsonl else '_output.json', args.input_file)
+
+    # Load the JSON file (or JSON Lines)
+    data = load_records(input_file)
+
+    # the last output is the baseline for an incremental run
+    previous = None
+    if args.incremental and os.path.exists(output_file):
+        previous = load_records(output_file)
+
+    # listings and ls-remote results are kept next to the output
+    cache = None
+    if args.cache:
+        cache = ScrapeCache(os.path.splitext(output_file)[0] + '_cache.sqlite',
+                            ls_remote_ttl=args.cache_ttl * 3600)
+
+    # smart-HTTP ref fetching keeps one connection pool per worker
+    refs = RefFetcher(pool_size=args.workers) if args.refs == 'http' else None
+
+    # gitiles JSON listings instead of archive downloads, the archive stays the fallback
+    # its pages are revalidated against the cache
+    lister = TreeCrawler(workers=args.workers, cache=cache) if args.listing == 'gitiles' else None
+
+    with RecordWriter(output_file) as writer:
+        count_files_in_all_repositories_git(data, parse_extensions(args.extensions), workers=args.workers, rate=args.rate,
+                                            rs_path_dir=args.rs_path_dir, previous=previous, cache=cache, refs=refs,
+                                            on_result=writer.write, lister=lister)
+
+    if cache:
+        cache.evict(max_bytes=args.cache_max_mb * 1024 * 1024)
+        cache.close()
+
+    metrics.report(args.metrics, args.trace)
+
+# command line options, the input file stays the first argument
+def parse_args():
+    parser = argparse.ArgumentParser(description="count files in git repositories listed in a json file")
+    parser.add_argument("input_file", help="json file of repositories with clone_url attributes")
+    parser.add_argument("--extensions", default=".rs",
+                        help="comma separated extensions to count, e.g. .rs,.c,.cpp,.java,.kt,.go "
+                             "or label=glob items, e.g. c++=*.cc,c++=*.cpp")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of repositories scanned at the same time")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="max requests per second to a single host, 0 for no limit")
+    parser.add_argument("--rs-path-dir", default=None,
+                        help="also write each repository's .rs paths here, e.g. analyzer/rs_paths")
+    parser.add_argument("--refs", choices=["git", "http"], default="git",
+                        help="fetch branches with git ls-remote or over pooled smart-HTTP connections")
+    parser.add_argument("--listing", choices=["archive", "gitiles"], default="archive",
+                        help="list files from the +archive tarball or from one gitiles ?format=JSON&recursive=1 response")
+    parser.add_argument("--incremental", action="store_true",
+                        help="reuse counts from the existing output for repositories whose head has not moved")
+    parser.add_argument("--jsonl", action="store_true",
+                        help="write <input>_output.jsonl, one line per repository as it finishes")
+    parser.add_argument("--cache", action="store_true",
+                        help="keep archive listings and ls-remote output in <output>_cache.sqlite")
+    parser.add_argument("--cache-ttl", type=float, default=6,
+                        help="hours before a cached ls-remote result is fetched again")
+    parser.add_argument("--cache-max-mb", type=float, default=512,
+                        help="size cap for cached listings and pages, least recently used are dropped first")
+    pipeline_metrics.add_arguments(parser)
+    return parser.parse_args()
+
+# turns the --extensions string into {label: [glob, ...]}
+# a bare .ext is its own label, repeated labels collect several globs
+def parse_extensions(spec):
+    patterns = {}
+    for item in spec.split(","):
+        label, _, pattern = item.strip().partition("=")
+        if not pattern:
+            pattern = "*" + label
+        patterns.setdefault(label, []).append(pattern)
+    return patterns
+
+# spaces out requests to the same host
+# rate is requests per second per host, 0 disables the limit
+class HostRateLimiter:
+    def __init__(self, rate=0):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    # blocks until the host of url may be contacted again
+    def wait(self, url):
+        if not self.interval:
+            return
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
 
 #updates the count attribute for all repositories using git
-def count_files_in_all_repositories_git(data, extension):
-    for repo_name, repo_info in data.items():
-        total = "total"
-        git_branches = "git_branches"
-        url = repo_info["clone_url"]
-        repo_info[total], repo_info[extension], repo_info[git_branches] = count_files_git(url, extension)
-        #print(repo_name)
-        #print(repo_info[extension])
-
-#count rs files, total files, and get commit hashes
-def count_files_git(repo_url, extension):
+# workers > 1 scans repositories in a thread pool, the work is waiting on
+# git and curl so threads are enough. results are written back in input order
+# with rs_path_dir set, the same archive pass also writes rs_paths/<repo>.txt
+# and the rs_path_file attribute, so rs_path_collector.py does not need to run
+# previous is an earlier output, repositories whose head commit matches it
+# keep their old counts and are not downloaded again
+# cache is an optional ScrapeCache that network results are read through
+# refs is an optional RefFetcher used in place of git ls-remote
+# lister is an optional TreeCrawler asked for the file listing before the archive
+# extensions is one extension, a list of them, or {label: glob(s)}, every
+# label gets its own count attribute filled from the same archive pass
+# on_result(repo_name, repo_info) is called for each repository once it is
+# filled in, in input order, e.g. to stream it out with a RecordWriter
+def count_files_in_all_repositories_git(data, extensions, workers=1, rate=0, rs_path_dir=None, previous=None,
+                                        cache=None, refs=None, on_result=None, lister=None):
+    total = "total"
+    git_branches = "git_branches"
+    extensions = extension_patterns(extensions)
+    limiter = HostRateLimiter(rate)
+    if rs_path_dir:
+        os.makedirs(rs_path_dir, exist_ok=True)
+
+    def count_repo(repo_name, repo_info):
+        path_file = None
+        if rs_path_dir:
+            path_file = os.path.join(rs_path_dir, repo_name.replace("/", "_") + ".txt")
+        previous_info = previous.get(repo_name) if previous else None
+        with metrics.repo(repo_name):
+            return count_files_git(repo_info["clone_url"], extensions, limiter, path_file, previous_info, cache, refs,
+                                   lister)
+
+    def store(repo_info, result):
+        # total, the extension counts, then git_branches, the order the output has always had
+        total_files, counts, branches, rs_path_file = result
+        repo_info[total] = total_files
+        repo_info.update(counts)
+        repo_info[git_branches] = branches
+        if rs_path_file and rs_path_dir:
+            # analyzer.py resolves rs_path_file relative to the folder holding rs_paths
+            repo_info["rs_path_file"] = os.path.join(os.path.basename(os.path.normpath(rs_path_dir)),
+                                                     os.path.basename(rs_path_file))
+        elif rs_path_file:
+            repo_info["rs_path_file"] = rs_path_file
+
+    def finish(repo_name, result):
+        store(data[repo_name], result)
+        if on_result:
+            on_result(repo_name, data[repo_name])
+
+    names = list(data.keys())
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(count_repo, names, [data[name] for name in names])
+            for repo_name, result in zip(names, results):
+                finish(repo_name, result)
+    else:
+        for repo_name in names:
+            finish(repo_name, count_repo(repo_name, data[repo_name]))
+
+#count files per extension, total files, and get commit hashes
+# returns total, {label: count}, branches and the rs_path_file written
+# rs_path_file, if given, receives the .rs paths from the same archive download
+# previous_info is this repository's entry from an earlier output, if any
+def count_files_git(repo_url, extensions, limiter=None, rs_path_file=None, previous_info=None, cache=None, refs=None,
+                    lister=None):
     # Construct the archive URL
     archive_url = repo_url + '/+archive/HEAD.tar.gz'
     
     # Get branches and commit hashes first
-    git_branches = get_branches_and_latest_commit(repo_url)
-
-    # Use curl to download the file listing without cloning
-    cmd = ['curl', '-L', archive_url]
-    tar_cmd = ['tar', '-tzf', '-']  # List all files
-
-    # Get the file list first
-    curl = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-    tar = subprocess.Popen(tar_cmd, stdin=curl.stdout, stdout=subprocess.PIPE, text=True)
-    
-    # Read all file paths from tar
-    file_list, _ = tar.communicate()
-    file_list = file_list.strip().split("\n")  # Convert to list
-
-    total_files = len(file_list)  # Count total files
-    count_extension = sum(1 for file in file_list if file.endswith(extension))  # Count matching extensions
-
-    return total_files, count_extension, git_branches
+    git_branches = get_branches_and_latest_commit(repo_url, limiter, cache, refs)
+
+    # Skip the download when the head is where it was last time
+    if previous_info and is_unchanged(previous_info, git_branches, extensions, rs_path_file):
+        metrics.count("unchanged repositories")
+        counts = {label: previous_info[label] for label in extension_patterns(extensions)}
+        return previous_info["total"], counts, git_branches, previous_info.get("rs_path_file")
+
+    # Stream the file listing without cloning or buffering it
+    listing = archive_listing(repo_url, head_commit(git_branches), cache, limiter, lister)
+    try:
+        total_files, counts, rs_path_file = scan_listing(listing, extensions, rs_path_file)
+    except subprocess.CalledProcessError:
+        print(f"[!] Failed to list archive: {archive_url}")
+        # no branches, so no head commit: --incremental never takes these zeros for a finished scan
+        return 0, dict.fromkeys(extension_patterns(extensions), 0), {}, None
+
+    return total_files, counts, git_branches, rs_path_file
+
+# true if an earlier scan of this repository can be reused as is
+def is_unchanged(previous_info, git_branches, extensions, rs_path_file=None):
+    if "total" not in previous_info:
+        return False
+    # a newly tracked extension needs a fresh pass
+    if any(label not in previous_info for label in extension_patterns(extensions)):
+        return False
+
+    commit = head_commit(git_branches)
+    if commit is None or commit != head_commit(previous_info.get("git_branches", {})):
+        return False
+
+    # a repository with matches also needs its rs_paths file from last time
+    if rs_path_file and previous_info.get(".rs", 1) > 0:
+        return "rs_path_file" in previous_info and os.path.exists(rs_path_file)
+    return True
 
 # Fetch all branches and their latest commit hashes from a remote repo.
-def get_branches_and_latest_commit(repo_url):
-    # Construct the archive URL
-    result = subprocess.run(["git", "ls-remote", repo_url], capture_output=True, text=True)
+# refs, if given, is tried first and git ls-remote is the fallback
+def get_branches_and_latest_commit(repo_url, limiter=None, cache=None, refs=None):
+    output = cache.get_ls_remote(repo_url) if cache else None
+    if output is None:
+        if limiter:
+            limiter.wait(repo_url)
+        with metrics.stage("ls-remote"):
+            output = refs.ls_remote(repo_url) if refs else None
+            if output is None:
+                result = subprocess.run(["git", "ls-remote", repo_url], capture_output=True, text=True)
+                output = result.stdout if result.returncode == 0 else None
+        if cache and output is not None:
+            cache.put_ls_remote(repo_url, output)
+    else:
+        metrics.count("ls-remote cache hits")
     
     branches = {}
-    if result.stdout:
-        for line in result.stdout.strip().split("\n"):
+    if output:
+        for line in output.strip().split("\n"):
             commit_hash, ref = line.split("\t")
             if ref.startswith("refs/heads/"):  # Extract only branch names
                 branch_name = ref.replace("refs/heads/", "")
@@ -74,63 +252,43 @@ def get_branches_and_latest_commit(repo_url):
 
        
 #get filenames from args
-def in_out_filenames(output_file_extension):
-    input_file = sys.argv[1]
+def in_out_filenames(output_file_extension, input_file=None):
+    if input_file is None:
+        input_file = sys.argv[1]
     root_name = os.path.splitext(input_file)[0]
     output_file = root_name + output_file_extension
 
     return input_file, output_file
 
+# the web-scraping functions share one crawler, so page connections are pooled
+crawler = TreeCrawler()
+
 #updates the count attribute for all repositories using web scraping
-def count_files_in_all_repositories(data, extension):
+# with a ScrapeCache, unchanged pages are revalidated instead of downloaded again
+def count_files_in_all_repositories(data, extension, cache=None):
+    crawler.cache = cache
     collect_main_branches(data)
     for repo_name, repo_info in data.items():
-        clone_url = repo_info.get('clone_url')
-        repo_info[extension] = count_files(clone_url, extension)
+        repo_info[extension] = count_files(repo_info.get('branches', []), extension)
  
-# dfs traversal of html for the git tree
-# counts .rs files for folders in stack, adds folders to stack
+# bfs traversal of html for the git tree, directory pages are fetched concurrently
+# counts .rs files under the branch urls
 # if option quickcount is true, returns early as soon as a .rs file is found
 def count_files(branches, extension, quickCount=False):
-    stack = branches
-    rs_file_count = 0
-
-    while stack:
-        current_url = stack.pop()
-        tree = get_tree(current_url)
-        if not tree:
-            continue
-
-        for item in tree.find_all('li'):
-            link = item.find('a')
-            if not link:
-                continue
-
-            # Check if it's a directory or a file
-            if 'FileList-item--gitTree' in item['class']:
-                # It's a directory, push URL to stack
-                file_url = urljoin(current_url, link['href'])
-                stack.append(file_url)
-
-            else:
-                # Count rs files, or exit early with flag
-                if link.text.endswith(extension):
-                    print("found rs")
-                    rs_file_count += 1
-                    if quickCount:
-                        return rs_file_count
-                    
-
-    return rs_file_count
+    return crawler.count_files(branches, extension, quickCount)
 
 # iterates over the git clone pages
 # gets links to filesystems named "main"
 # can be refactored to get all filesystems
 # not the same as git branches. Html dom branches
+# repository pages are fetched concurrently, results are stored in input order
 def collect_main_branches(data):
-    for repo_name, repo_info in data.items():
+    names = list(data.keys())
+    with ThreadPoolExecutor(max_workers=crawler.workers) as pool:
+        main_urls = pool.map(get_main_branch_url, [data[name].get('clone_url') for name in names])
+    for repo_name, main_url in zip(names, main_urls):
+        repo_info = data[repo_name]
         clone_url = repo_info.get('clone_url')
-        main_url = get_main_branch_url(clone_url)
         if main_url:
             if 'branches' not in repo_info:
                 repo_info['branches'] = []
@@ -162,79 +320,14 @@ def count_branches(data):
 
 # TODO (possibly) get all branches instead of filtering for main
 
+# link to the "main" branch from the repository page's branch list
 def get_main_branch_url(repo_url):
-    response = requests.get(repo_url)
-    if response.status_code != 200:
-        return None
-
-    soup = BeautifulSoup(response.text, 'html.parser')
-
-    # Locate the list item with the link to the main branch
-    site_content = soup.find('div', class_='Site-content')
-    if not site_content:
-        return None
-
-    container = site_content.find('div', class_=lambda c: c and 'Container' in c.strip())
-    if not container:
-        return None
-
-    repo_shortlog = container.find('div', class_='RepoShortlog')
-    if not repo_shortlog:
-        return None
-
-    reflist = repo_shortlog.find('div', class_='RefList RefList--responsive')
-    if not reflist:
-        return None
-
-    reflist_items = reflist.find('ul', class_='RefList-items')
-    if not reflist_items:
-        return None
-    
-    # Search inside the 'li' element for an 'a' tag containing 'main'
-    for item in reflist_items.find_all('li', class_='RefList-item'):
-        link = item.find('a')
-        if link and link.text.strip().lower() == 'main':
-            # Use urljoin to avoid double paths
-            return urljoin(repo_url, link['href'])
-
-    return None
-
+    return crawler.main_branch_url(repo_url)
 
+# the FileList of a tree page, only that part of the html is parsed
 def get_tree(url):
-    response = requests.get(url)
-    if response.status_code != 200:
-        return None
-
-    soup = BeautifulSoup(response.text, 'html.parser')
-
-    #print("valid url")
-
-    # Locate the list item with the link to the main branch
-    site_content = soup.find('div', class_='Site-content')
-    if not site_content:
-        return None
-
-    container = site_content.find('div', class_=lambda c: c and 'Container' in c.strip())
-    if not container:
-        return None
-    
-    tree_detail = container.find('div', class_='TreeDetail')
-    if not tree_detail:
-        return None
+    return crawler.file_list(url)
     
 
-    file_list = tree_detail.find('ol', class_='FileList')
-    if not file_list:
-        return None
-    
-    #print("found filelist")
-    return file_list
-    
-
-
-def update_json_file(data, filename):
-    with open(filename, 'w') as f:
-        json.dump(data, f, indent=4)
-        f.close()
 
 main()
\ No newline at end of file
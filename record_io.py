@@ -0,0 +1,85 @@
+import json
+import os
+import threading
+
+# repository results are either one .json object {name: info, ...} or
+# JSON Lines (.jsonl), one {name: info} object per line. the extension picks
+# the format everywhere. JSON Lines is appended as each repository finishes and
+# read back a line at a time, so neither side holds the whole file in memory
+
+
+def is_jsonl(filename):
+    return filename.endswith(".jsonl")
+
+
+# yields (name, info) from a file in either format
+# only the current line is in memory when the file is JSON Lines
+def iter_records(filename):
+    with open(filename, "r", encoding="utf-8") as f:
+        if not is_jsonl(filename):
+            yield from json.load(f).items()
+            return
+        for line in f:
+            line = line.strip()
+            if line:
+                yield from json.loads(line).items()
+
+
+# the whole file as {name: info}
+def load_records(filename):
+    return dict(iter_records(filename))
+
+
+# writes (name, info) records to filename in the format its extension asks for
+# everything goes to <filename>.tmp first and replaces filename only on close,
+# so an interrupted run leaves the previous output in place. JSON Lines records
+# are flushed to the .tmp as they are written, a crash keeps them there.
+# a .json file has to be one object, so it is collected and dumped on close
+# safe to call write from several threads
+class RecordWriter:
+    def __init__(self, filename, indent=4):
+        self.filename = filename
+        self.temp_file = filename + ".tmp"
+        self.indent = indent
+        self.lock = threading.Lock()
+        self.records = None if is_jsonl(filename) else {}
+        self.file = open(self.temp_file, "w", encoding="utf-8") if is_jsonl(filename) else None
+
+    def write(self, name, info):
+        with self.lock:
+            if self.file:
+                self.file.write(json.dumps({name: info}) + "\n")
+                self.file.flush()
+            else:
+                self.records[name] = info
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+            elif self.records is not None:
+                with open(self.temp_file, "w", encoding="utf-8") as f:
+                    json.dump(self.records, f, indent=self.indent)
+                self.records = None
+            else:
+                return
+            os.replace(self.temp_file, self.filename)
+
+    # stops without touching filename, a .jsonl's records stay in the .tmp
+    def abort(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+            self.records = None
+
+    def __enter__(self):
+        return self
+
+    # the output is only replaced when the block finished cleanly
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
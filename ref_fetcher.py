@@ -0,0 +1,109 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+from pipeline_metrics import metrics
+
+
+# fetches branch refs over git smart-HTTP on pooled, reused connections
+# asks for refs/heads/ only with protocol v2 ls-refs, so the server filters,
+# and falls back to the v0 info/refs advertisement for servers without v2.
+# one session per thread, connections to a host are kept open between repos
+class RefFetcher:
+    def __init__(self, pool_size=10, timeout=60, ref_prefix="refs/heads/"):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.ref_prefix = ref_prefix
+        self.local = threading.local()
+
+    def session(self):
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["User-Agent"] = "git/2.0 (pyscraper)"
+            self.local.session = session
+        return session
+
+    # text in git ls-remote format, "<hash>\t<ref>" per line, or None on failure
+    # only http(s) urls are handled, anything else returns None
+    def ls_remote(self, repo_url):
+        if not repo_url.startswith(("http://", "https://")):
+            return None
+        try:
+            refs = self.ls_refs_v2(repo_url)
+            if refs is None:
+                refs = self.info_refs_v0(repo_url)
+        except (requests.RequestException, ValueError):
+            # ValueError: a 200 that is not pkt-line, e.g. an html page
+            return None
+        if refs is None:
+            return None
+        return "".join(f"{commit_hash}\t{ref}\n" for commit_hash, ref in refs)
+
+    # protocol v2 ls-refs with a server side ref-prefix filter
+    def ls_refs_v2(self, repo_url):
+        body = (pkt_line(b"command=ls-refs\n") + b"0001" +
+                pkt_line(b"ref-prefix " + self.ref_prefix.encode() + b"\n") + b"0000")
+        response = self.session().post(
+            repo_url.rstrip("/") + "/git-upload-pack",
+            data=body,
+            headers={"Content-Type": "application/x-git-upload-pack-request",
+                     "Accept": "application/x-git-upload-pack-result",
+                     "Git-Protocol": "version=2"},
+            timeout=self.timeout)
+        metrics.count("ref bytes", len(response.content))
+        if response.status_code != 200:
+            return None
+
+        refs = []
+        for line in read_pkt_lines(response.content):
+            if line is None:
+                break
+            fields = line.decode("utf-8", "replace").rstrip("\n").split(" ")
+            # anything that is not "<hash> <ref>" means the server did not speak v2
+            if len(fields) < 2 or len(fields[0]) != 40:
+                return None
+            refs.append((fields[0], fields[1]))
+        return refs
+
+    # protocol v0 ref advertisement, filtered here
+    def info_refs_v0(self, repo_url):
+        response = self.session().get(
+            repo_url.rstrip("/") + "/info/refs",
+            params={"service": "git-upload-pack"},
+            timeout=self.timeout)
+        metrics.count("ref bytes", len(response.content))
+        if response.status_code != 200:
+            return None
+
+        refs = []
+        for line in read_pkt_lines(response.content):
+            if line is None or line.startswith(b"#"):
+                continue
+            # the first ref carries the capabilities after a NUL
+            line = line.split(b"\0")[0].decode("utf-8", "replace").rstrip("\n")
+            commit_hash, _, ref = line.partition(" ")
+            if ref.startswith(self.ref_prefix):
+                refs.append((commit_hash, ref))
+        return refs
+
+
+def pkt_line(data):
+    return b"%04x" % (len(data) + 4) + data
+
+
+# splits a pkt-line stream, flush/delim/end packets come back as None
+# raises ValueError when body is not pkt-line
+def read_pkt_lines(body):
+    pos = 0
+    while pos + 4 <= len(body):
+        length = int(body[pos:pos + 4], 16)
+        if length < 4:
+            pos += 4
+            yield None
+            continue
+        yield body[pos + 4:pos + length]
+        pos += length
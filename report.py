@@ -1,6 +1,6 @@
-import json
 import sys
 import matplotlib.pyplot as plt
+from record_io import RecordWriter, iter_records
 
 def main():
 
@@ -9,10 +9,9 @@ def main():
 
     #filename = output_filtered_repos(filename)
 
-    # Load the JSON file
-    with open(filename, "r", encoding="utf-8") as f:
-        data = json.load(f)
-        f.close()
+    # Load the JSON file (or stream JSON Lines), keeping only what is plotted
+    data = {name: {key: info[key] for key in ("name", total_size_key, ".rs")}
+            for name, info in iter_records(filename)}
     
     rs_repos = [repo_info['name'] for repo_info in data.values()]
 
@@ -25,18 +24,18 @@ def main():
     plot_by_significance([data[name] for name in rs_repos])
 
 def output_filtered_repos(filename):
-   # Load the JSON file
-    with open(filename, "r", encoding="utf-8") as f:
-        data = json.load(f)
-        f.close()
-
-        rs_repos = get_repos(data, ".rs")
-
-    print("number of projects containing .rs files: ", len(rs_repos))
-    print("out of ", len(data), "total projects")
-
-    with open("filtered_rs_repos.json", "w", encoding="utf-8") as out:
-        json.dump({name: data[name] for name in rs_repos}, out, indent=2)
+    # repositories are streamed from the input to the output one at a time
+    total_count = 0
+    rs_count = 0
+    with RecordWriter("filtered_rs_repos.json", indent=2) as out:
+        for repo_name, repo_info in iter_records(filename):
+            total_count += 1
+            if repo_info[".rs"] > 0:
+                rs_count += 1
+                out.write(repo_name, repo_info)
+
+    print("number of projects containing .rs files: ", rs_count)
+    print("out of ", total_count, "total projects")
 
     return "filtered_rs_repos.json"
     
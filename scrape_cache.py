@@ -0,0 +1,150 @@
+import codecs
+import sqlite3
+import threading
+import time
+import zlib
+
+
+# persistent cache for what the scraper fetches over the network
+# archive listings are keyed on (clone_url, commit) so they never go stale,
+# ls-remote output is keyed on the url and expires after ls_remote_ttl seconds,
+# gitiles pages are kept with their ETag / Last-Modified for revalidation.
+# one sqlite file, safe to share between the scraper's worker threads
+class ScrapeCache:
+    def __init__(self, path, ls_remote_ttl=6 * 3600):
+        self.path = path
+        self.ls_remote_ttl = ls_remote_ttl
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS listings (
+                clone_url TEXT NOT NULL,
+                commit_hash TEXT NOT NULL,
+                paths BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (clone_url, commit_hash)
+            );
+            CREATE TABLE IF NOT EXISTS ls_remote (
+                clone_url TEXT PRIMARY KEY,
+                output TEXT NOT NULL,
+                fetched REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+        """)
+        self.db.commit()
+
+    # raw git ls-remote output, or None if missing or older than the ttl
+    def get_ls_remote(self, clone_url):
+        with self.lock:
+            row = self.db.execute("SELECT output, fetched FROM ls_remote WHERE clone_url = ?",
+                                  (clone_url,)).fetchone()
+        if row is None or time.time() - row[1] > self.ls_remote_ttl:
+            return None
+        return row[0]
+
+    def put_ls_remote(self, clone_url, output):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO ls_remote VALUES (?, ?, ?)",
+                            (clone_url, output, time.time()))
+            self.db.commit()
+
+    # generator over a stored archive listing, or None if it is not cached
+    def get_listing(self, clone_url, commit):
+        with self.lock:
+            row = self.db.execute("SELECT paths FROM listings WHERE clone_url = ? AND commit_hash = ?",
+                                  (clone_url, commit)).fetchone()
+            if row is None:
+                return None
+            self.db.execute("UPDATE listings SET last_used = ? WHERE clone_url = ? AND commit_hash = ?",
+                            (time.time(), clone_url, commit))
+            self.db.commit()
+        return decompress_lines(row[0])
+
+    # passes paths through unchanged and stores them once the listing is complete
+    # the listing is compressed as it streams, a failed download stores nothing
+    def record_listing(self, clone_url, commit, paths):
+        compressor = zlib.compressobj()
+        chunks = []
+        for path in paths:
+            chunks.append(compressor.compress((path + "\n").encode("utf-8")))
+            yield path
+        chunks.append(compressor.flush())
+        blob = b"".join(chunks)
+
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?)",
+                            (clone_url, commit, blob, len(blob), time.time()))
+            self.db.commit()
+
+    # (body, etag, last_modified) of a stored response, or None
+    def get_response(self, url):
+        with self.lock:
+            row = self.db.execute("SELECT body, etag, last_modified FROM responses WHERE url = ?",
+                                  (url,)).fetchone()
+            if row is None:
+                return None
+            self.db.execute("UPDATE responses SET last_used = ? WHERE url = ?", (time.time(), url))
+            self.db.commit()
+        return zlib.decompress(row[0]).decode("utf-8"), row[1], row[2]
+
+    def put_response(self, url, body, etag=None, last_modified=None):
+        blob = zlib.compress(body.encode("utf-8"))
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                            (url, etag, last_modified, blob, len(blob), time.time()))
+            self.db.commit()
+
+    # drops listings and responses unused for max_age seconds, then the least
+    # recently used of either until together they fit in max_bytes.
+    # expired ls-remote rows go too
+    def evict(self, max_bytes=None, max_age=None):
+        now = time.time()
+        with self.lock:
+            self.db.execute("DELETE FROM ls_remote WHERE fetched < ?", (now - self.ls_remote_ttl,))
+            if max_age is not None:
+                self.db.execute("DELETE FROM listings WHERE last_used < ?", (now - max_age,))
+                self.db.execute("DELETE FROM responses WHERE last_used < ?", (now - max_age,))
+            if max_bytes is not None:
+                rows = self.db.execute("SELECT 'listing', clone_url, commit_hash, size, last_used FROM listings "
+                                       "UNION ALL SELECT 'response', url, '', size, last_used FROM responses "
+                                       "ORDER BY last_used").fetchall()
+                total = sum(row[3] for row in rows)
+                for kind, key, commit, size, _ in rows:
+                    if total <= max_bytes:
+                        break
+                    if kind == "listing":
+                        self.db.execute("DELETE FROM listings WHERE clone_url = ? AND commit_hash = ?",
+                                        (key, commit))
+                    else:
+                        self.db.execute("DELETE FROM responses WHERE url = ?", (key,))
+                    total -= size
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+# yields the lines of a zlib blob without inflating all of it at once
+def decompress_lines(blob, chunk_size=1 << 16):
+    decompressor = zlib.decompressobj()
+    # a chunk can end in the middle of a multi-byte character
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    for start in range(0, len(blob), chunk_size):
+        pending += decoder.decode(decompressor.decompress(blob[start:start + chunk_size]))
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    pending += decoder.decode(decompressor.flush(), final=True)
+    if pending:
+        yield pending
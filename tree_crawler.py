@@ -0,0 +1,258 @@
+import json
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import quote, urljoin, urlparse
+
+import requests
+from bs4 import BeautifulSoup, SoupStrainer
+from requests.adapters import HTTPAdapter
+
+from pipeline_metrics import metrics
+
+# only these nodes of a gitiles page are built, the rest of the html is skipped
+FILE_LIST = SoupStrainer("ol", class_="FileList")
+REF_LIST = SoupStrainer("ul", class_="RefList-items")
+
+# gitiles prefixes every JSON response with this line against XSSI
+JSON_PREFIX = ")]}'"
+
+# a page under /+/<full commit sha>/ can never change
+COMMIT_URL = re.compile(r"/\+/[0-9a-f]{40}(/|\?|$)")
+
+
+# reads gitiles trees for the web-scraping path and as a listing backend
+# with use_json, gitiles' machine-readable endpoints are asked first:
+# ?format=JSON for one directory or the branch list, and ?format=JSON&recursive=1
+# for every file of a tree in one response. hosts that do not answer them are
+# remembered and get the html pages from then on.
+# html is crawled breadth-first, up to workers directory pages at once, each
+# thread keeps its own pooled session so connections are reused from page to page.
+# pages are parsed with a SoupStrainer, so only the FileList / RefList is built
+# with a cache (scrape_cache.ScrapeCache), pages that came with an ETag or
+# Last-Modified are stored and revalidated next time, a 304 serves the stored
+# copy. pages pinned to a commit are served from the cache without asking.
+# parsed directory listings are memoized by url and validator (or commit)
+class TreeCrawler:
+    def __init__(self, workers=8, timeout=60, limiter=None, use_json=True, cache=None):
+        self.workers = workers
+        self.timeout = timeout
+        self.limiter = limiter
+        self.use_json = use_json
+        self.cache = cache
+        self.html_only_hosts = set()
+        self.parsed = {}
+        self.local = threading.local()
+
+    def session(self):
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self.local.session = session
+        return session
+
+    # page text, or None for anything but a 200
+    def fetch(self, url, limiter=None):
+        return self.fetch_page(url, limiter)[0]
+
+    # (page text, validator) where validator is the commit, ETag or Last-Modified
+    # that identifies this version of the page, None when it has none
+    # a page is cached only if it has one, without it there is nothing to revalidate
+    def fetch_page(self, url, limiter=None):
+        pinned = COMMIT_URL.search(url)
+        cached = self.cache.get_response(url) if self.cache else None
+        if cached and pinned:
+            return cached[0], pinned.group(0)
+
+        headers = {}
+        if cached:
+            body, etag, last_modified = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        limiter = limiter or self.limiter
+        if limiter:
+            limiter.wait(url)
+        try:
+            with metrics.stage("gitiles fetch"):
+                response = self.session().get(url, timeout=self.timeout, headers=headers)
+        except requests.RequestException:
+            return None, None
+        metrics.count("gitiles bytes", len(response.content))
+        if response.status_code == 304 and cached:
+            metrics.count("gitiles 304s")
+            return cached[0], cached[1] or cached[2]
+        if response.status_code != 200:
+            return None, None
+
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        validator = pinned.group(0) if pinned else etag or last_modified
+        if self.cache and validator:
+            self.cache.put_response(url, response.text, etag, last_modified)
+        return response.text, validator
+
+    # decoded ?format=JSON response for url, or None when the host has no JSON for us
+    def fetch_json(self, url, params="format=JSON", limiter=None):
+        host = urlparse(url).netloc
+        if not self.use_json or host in self.html_only_hosts:
+            return None
+        text = self.fetch(url + ("&" if "?" in url else "?") + params, limiter)
+        if text is not None and text.startswith(JSON_PREFIX):
+            text = text[len(JSON_PREFIX):]
+        try:
+            return json.loads(text) if text is not None else None
+        except json.JSONDecodeError:
+            # an html error page or a server without JSON, do not ask it again
+            self.html_only_hosts.add(host)
+            return None
+
+    # called when the html of a page was there but its JSON was not,
+    # the host is not asked for JSON pages again
+    def json_failed(self, url):
+        if self.use_json:
+            self.html_only_hosts.add(urlparse(url).netloc)
+
+    # every file path under a tree url from one recursive JSON listing, or None
+    def recursive_files(self, url, limiter=None):
+        tree = self.fetch_json(url, "format=JSON&recursive=1", limiter)
+        if not isinstance(tree, dict) or "entries" not in tree:
+            return None
+        # gitlinks (submodules) show up as "commit" entries, like empty folders in an archive
+        return [entry["name"] + ("/" if entry.get("type") == "commit" else "")
+                for entry in tree["entries"] if entry.get("type") != "tree"]
+
+    # the repository's file listing at commit (HEAD if None) in the same form as
+    # the +archive tar listing: files plus a "dir/" entry for every folder, so
+    # scan_listing totals match. None when gitiles would not give it as JSON
+    def tree_listing(self, repo_url, commit=None, limiter=None):
+        files = self.recursive_files(f"{repo_url.rstrip('/')}/+/{commit or 'HEAD'}/", limiter)
+        if files is None:
+            return None
+        listing = []
+        folders = set()
+        for path in files:
+            parent = path.rstrip("/").rpartition("/")[0]
+            missing = []
+            while parent and parent not in folders:
+                folders.add(parent)
+                missing.append(parent + "/")
+                parent = parent.rpartition("/")[0]
+            listing.extend(reversed(missing))
+            listing.append(path)
+        return listing
+
+    # the FileList <ol> of a tree page, or None
+    def file_list(self, url):
+        text = self.fetch(url)
+        if text is None:
+            return None
+        return BeautifulSoup(text, "html.parser", parse_only=FILE_LIST).find("ol")
+
+    # [(name, url, is_dir)] for one tree page, or None if it could not be read
+    def list_dir(self, url):
+        tree = self.fetch_json(url)
+        if isinstance(tree, dict) and "entries" in tree:
+            base = url.rstrip("/") + "/"
+            return [(entry["name"], base + quote(entry["name"]), entry.get("type") == "tree")
+                    for entry in tree["entries"]]
+
+        text, validator = self.fetch_page(url)
+        if text is None:
+            return None
+        self.json_failed(url)
+        # a page that revalidated to the same version is not parsed again
+        entries = self.parsed.get((url, validator)) if validator else None
+        if entries is None:
+            entries = self.parse_file_list(url, text)
+            if validator:
+                self.parsed[(url, validator)] = entries
+        return entries
+
+    @staticmethod
+    def parse_file_list(url, text):
+        tree = BeautifulSoup(text, "html.parser", parse_only=FILE_LIST).find("ol")
+        entries = []
+        for item in tree.find_all("li") if tree else []:
+            link = item.find("a")
+            if not link:
+                continue
+            is_dir = "FileList-item--gitTree" in item.get("class", [])
+            entries.append((link.text, urljoin(url, link["href"]), is_dir))
+        return entries
+
+    # tree url of the "main" branch, from the JSON branch list or else the first
+    # (branches) RefList of the repository page. it ends in "/": without it
+    # gitiles shows the branch's commit instead of its tree
+    def main_branch_url(self, repo_url):
+        refs = self.fetch_json(repo_url.rstrip("/") + "/+refs/heads")
+        if isinstance(refs, dict):
+            for ref in refs:
+                if ref.replace("refs/heads/", "", 1).lower() == "main":
+                    return f"{repo_url.rstrip('/')}/+/refs/heads/{ref.replace('refs/heads/', '', 1)}/"
+            return None
+
+        text = self.fetch(repo_url)
+        if text is None:
+            return None
+        self.json_failed(repo_url)
+        reflist_items = BeautifulSoup(text, "html.parser", parse_only=REF_LIST).find("ul")
+        if not reflist_items:
+            return None
+        for item in reflist_items.find_all("li", class_="RefList-item"):
+            link = item.find("a")
+            if link and link.text.strip().lower() == "main":
+                return tree_url(urljoin(repo_url, link["href"]))
+        return None
+
+    # files ending in extension under start_urls. a tree gitiles lists recursively
+    # as JSON takes one request, any other is crawled level by level
+    # quick_count stops at the first match and returns 1, pages still queued are dropped
+    def count_files(self, start_urls, extension, quick_count=False):
+        start_urls = [tree_url(url) for url in start_urls]
+        count = 0
+        crawl = []
+        for url in start_urls:
+            files = self.recursive_files(url)
+            if files is None:
+                crawl.append(url)
+                continue
+            count += sum(1 for path in files if path.endswith(extension))
+            if quick_count and count:
+                return 1
+        if not crawl:
+            return count
+
+        frontier = deque(crawl)
+        seen = set(crawl)
+        pending = set()
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            while frontier or pending:
+                while frontier and len(pending) < self.workers:
+                    pending.add(pool.submit(self.list_dir, frontier.popleft()))
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for name, url, is_dir in future.result() or []:
+                        if is_dir:
+                            if url not in seen:
+                                seen.add(url)
+                                frontier.append(url)
+                        elif name.endswith(extension):
+                            count += 1
+                            if quick_count:
+                                return 1
+            return count
+        finally:
+            # an early return does not wait for the pages still in flight
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+# a gitiles /+/<ref> url as the tree view, i.e. with the trailing "/"
+def tree_url(url):
+    return url.rstrip("/") + "/"